@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Offline fixtures for the benchmarks - synthetic or recorded Oanda candle responses and stubbed yf.download frames
+"""
+
+
+###########################################
+#import libraries
+import numpy as np
+import pandas as pd
+import json
+import bisect
+from trade_read.oanda_read import oanda_granularity_seconds
+
+
+def synthetic_candles(n, granularity = 'M5', MBA_candles = False, start = 1672617600, seed = 0, weekends = True):
+    '''
+    (int, str, bool, int, int, bool)->(list of dictionaries)
+    Return n candles in the Oanda InstrumentsCandles format, a seeded random walk around 1.1 quoted to 5 decimals.
+    start is the unix timestamp of the first candle. With weekends the FX weekend closure (Friday 21:00 to Sunday
+    21:00 UTC) is skipped, as in real responses. The last candle is incomplete.
+    '''
+    step = oanda_granularity_seconds()[granularity]
+    rng = np.random.default_rng(seed)
+
+    #candle open times, generated in blocks until n open market times are collected
+    times = np.empty(0, dtype=np.int64)
+    t = start
+    while len(times) < n:
+        block = t + step * np.arange(2 * n, dtype=np.int64)
+        if weekends:
+            day = (block // 86400 + 3) % 7
+            hour = (block % 86400) // 3600
+            closed = (day == 5) | ((day == 4) & (hour >= 21)) | ((day == 6) & (hour < 21))
+            block = block[~closed]
+        times = np.concatenate([times, block])
+        t += step * 2 * n
+    times = times[:n]
+
+    close = 1.1 + np.cumsum(rng.normal(0, 2e-5 * np.sqrt(step), n))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) + rng.uniform(0, 1e-4, n)
+    low = np.minimum(open_, close) - rng.uniform(0, 1e-4, n)
+    spread = rng.uniform(5e-5, 2e-4, n) / 2
+    volume = rng.integers(1, 500, n)
+    stamps = np.datetime_as_string(times.astype('datetime64[s]').astype('datetime64[ns]'), unit='ns')
+
+    def block(offset):
+        return [{'o': f"{o:.5f}", 'h': f"{h:.5f}", 'l': f"{l:.5f}", 'c': f"{c:.5f}"}
+                for o, h, l, c in zip(open_ + offset, high + offset, low + offset, close + offset)]
+
+    blocks = {'mid': block(0)}
+    if MBA_candles:
+        blocks['bid'] = block(-spread)
+        blocks['ask'] = block(spread)
+
+    candles = []
+    for i in range(n):
+        candle = {'complete': i < n - 1, 'volume': int(volume[i]), 'time': stamps[i] + 'Z'}
+        for name, values in blocks.items():
+            candle[name] = values[i]
+        candles.append(candle)
+
+    return candles
+
+def load_recorded(path):
+    '''
+    (str)->(list of dictionaries)
+    Return the candles of a recorded InstrumentsCandles JSON response, e.g. saved with json.dump(client.request(r), f)
+    '''
+    with open(path) as f:
+        return json.load(f)['candles']
+
+
+class FixtureClient():
+    """
+    oandapyV20 API compatible client replaying a fixed candle history offline
+
+    Keyword Args:
+    candles - Required, list of candles in the InstrumentsCandles format, sorted by time
+
+    Serves from + count, from + to and count only requests like the candles endpoint. Every response is decoded from
+    JSON text, so the JSON decode cost of a real response is part of each request.
+    """
+
+    def __init__(self, candles = None):
+
+        #one pre-serialised JSON string per candle, a response is a join and a decode
+        self.json = [json.dumps(candle) for candle in candles]
+        self.times = np.array([candle['time'][:19] for candle in candles], dtype='datetime64[s]').astype(np.int64).tolist()
+        self.requests = 0
+
+    def request(self, endpoint):
+
+        params = endpoint.params
+        self.requests += 1
+
+        count = int(params.get('count', 500))
+
+        if 'from' in params:
+            i = bisect.bisect_left(self.times, int(float(params['from'])))
+            j = bisect.bisect_left(self.times, int(float(params['to']))) if 'to' in params else i + count
+        else:
+            j = len(self.times)
+            i = max(0, j - count)
+
+        response = json.loads('{"candles": [' + ','.join(self.json[i:j]) + ']}')
+        endpoint.response = response
+
+        return response
+
+
+def stub_frame(n, seed = 0):
+    '''
+    (int, int)->(pandas dataframe)
+    Return an n row daily OHLCV frame in the single ticker yf.download layout
+    '''
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, n))
+
+    return pd.DataFrame({'Open': close, 'High': close + 1, 'Low': close - 1, 'Close': close, 'Adj Close': close,
+                         'Volume': rng.integers(1000, 100000, n)},
+                        index=pd.date_range('2000-01-03', periods=n, freq='B', name='Date'))
+
+class stub_download:
+
+    '''
+    Callable replacing yf.download with pre-built frames, no network.
+    A single ticker returns the flat layout, a list of tickers the group_by = 'ticker' MultiIndex layout.
+
+    rows : int, rows per ticker. Default 2500
+    '''
+
+    def __init__(self, rows = 2500):
+
+        self.frame = stub_frame(rows)
+
+    def __call__(self, tickers, group_by = 'column', threads = True, **kwargs):
+
+        import yfinance as yf
+        yf.shared._ERRORS = {}
+
+        if isinstance(tickers, str):
+            return self.frame.copy()
+
+        return pd.concat({ticker.upper(): self.frame for ticker in tickers}, axis=1)
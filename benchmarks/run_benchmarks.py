@@ -0,0 +1,531 @@
+# -*- coding: utf-8 -*-
+"""
+Offline benchmark suite of the trade_read entry points
+
+Replays synthetic (or recorded) Oanda candle responses and stubbed yf.download frames through the real reader code,
+no network or credentials needed. Run from the repository root
+
+python -m benchmarks.run_benchmarks                     run every benchmark and print the results
+python -m benchmarks.run_benchmarks --filter parse      only the benchmark groups whose name contains 'parse'
+python -m benchmarks.run_benchmarks --quick             fewer repeats, for a fast check
+python -m benchmarks.run_benchmarks --save-baseline     write the results to benchmarks/baseline.json, a filtered
+                                                        run only replaces its own results
+python -m benchmarks.run_benchmarks --compare           compare with benchmarks/baseline.json, exit 1 on a regression
+python -m benchmarks.run_benchmarks --recorded r.json   also parse a recorded InstrumentsCandles response
+
+Every benchmark reports p50, p90 and p99 latency over its repeats, throughput in rows/sec at p50 and the peak Python
+heap allocation (tracemalloc, numpy and pandas buffers included) of one extra traced run. p90 and p99 are only
+reported with enough repeats to estimate them, see PERCENTILE_MIN_SAMPLES.
+
+Latencies are only comparable on the machine the baseline was recorded on. The committed baseline.json is a record of
+one machine, not a target. Before comparing, re-record the baseline on your machine from the unchanged code, then
+compare after the change:
+
+git stash; python -m benchmarks.run_benchmarks --save-baseline; git stash pop
+python -m benchmarks.run_benchmarks --compare
+
+Import times depend on third party packages and the disk cache rather than on this package, they are only checked
+against the absolute IMPORT_CEILINGS and the lazy import rule, never against the baseline.
+"""
+
+
+###########################################
+#import libraries
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from trade_read.oanda_read import (OandaHistoricCandles, parse_candles, resample_candles, candle_qc, compact_candles,
+                                   oanda_granularity_seconds, candle_price_decimals)
+from trade_read.yahoo_finance_read import yfinance_ticker_reader, yfinance_universe_reader
+from trade_read.columnar import save_columnar, load_columnar
+from benchmarks.fixtures import synthetic_candles, load_recorded, FixtureClient, stub_download
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+#a benchmark regresses when its p50 latency or peak memory exceeds the baseline by this factor. Back to back runs of
+#unchanged code on a shared single CPU machine differ by up to 1.3x, a tighter factor fails without a change
+DEFAULT_THRESHOLD = 1.5
+
+#latencies below this are too noisy to flag as regressions
+MIN_COMPARE_SECONDS = 0.005
+
+#fewest timed repeats a latency percentile is reported for, e.g. the p99 of 5 repeats would just be their maximum
+PERCENTILE_MIN_SAMPLES = {50: 1, 90: 10, 99: 100}
+
+
+def percentiles(latencies):
+    '''
+    (list of floats)->(dictionary)
+    Return the p50, p90 and p99 of latencies, None for a percentile with fewer than PERCENTILE_MIN_SAMPLES samples
+    '''
+    return {f"p{q}": float(np.percentile(latencies, q)) if len(latencies) >= PERCENTILE_MIN_SAMPLES[q] else None
+            for q in PERCENTILE_MIN_SAMPLES}
+
+
+def measure(fn, repeats = 5, rows = None, warmup = 1, setup = None):
+    '''
+    (function, int, int, int, function)->(dictionary)
+    Time fn() repeats times after warmup calls and trace the peak memory of one extra call.
+    setup(), if given, runs untimed before every call, e.g. to remove files written by the previous call.
+    '''
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        fn()
+
+    latencies = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    result = percentiles(latencies)
+    p50 = result['p50']
+
+    return {**result,
+            'rows': rows,
+            'rows_per_second': rows / p50 if rows and p50 > 0 else None,
+            'peak_mib': peak / 2**20,
+            'repeats': repeats}
+
+
+class fixture_cache:
+
+    '''
+    Synthetic candle lists and replay clients, built once per (n, granularity, MBA) and shared by the benchmarks.
+    Fixture generation is never timed.
+    '''
+
+    def __init__(self):
+
+        self.candles_cache = {}
+        self.client_cache = {}
+        self.frame_cache = {}
+
+    def candles(self, n, granularity = 'M5', MBA_candles = False):
+
+        key = (n, granularity, MBA_candles)
+        if key not in self.candles_cache:
+            self.candles_cache[key] = synthetic_candles(n, granularity, MBA_candles)
+        return self.candles_cache[key]
+
+    def client(self, n, granularity = 'M5', MBA_candles = False):
+
+        key = (n, granularity, MBA_candles)
+        if key not in self.client_cache:
+            self.client_cache[key] = FixtureClient(self.candles(n, granularity, MBA_candles))
+        return self.client_cache[key]
+
+    def frame(self, n, granularity = 'M5', MBA_candles = False):
+
+        key = (n, granularity, MBA_candles)
+        if key not in self.frame_cache:
+            self.frame_cache[key] = parse_candles(self.candles(n, granularity, MBA_candles), MBA_candles).set_index('Time')
+        return self.frame_cache[key]
+
+
+def fixture_dates(candles, granularity):
+    '''
+    (list of dictionaries, str)->(str, str)
+    Return the start and end date strings covering every candle of a fixture
+    '''
+    first = pd.Timestamp(candles[0]['time'].rstrip('Z'))
+    last = pd.Timestamp(candles[-1]['time'].rstrip('Z')) + pd.Timedelta(seconds=oanda_granularity_seconds()[granularity])
+
+    return first.strftime('%Y-%m-%d'), (last + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def parse_per_candle(candles, MBA_candles = False):
+    '''
+    (list of dictionaries, bool)->(pandas dataframe)
+    Reference copy of the candle parsing before parse_candles - a dictionary per candle, then pd.to_datetime
+    '''
+    if MBA_candles == False:
+        results= [{"Time":x['time'],"Open":float(x['mid']['o']),"High":float(x['mid']['h']),
+                "Low":float(x['mid']['l']),"Close":float(x['mid']['c']),
+                "Volume":float(x['volume']),"Complete":x['complete']} for x in candles]
+    else:
+        results= [{"Time":x['time'],"Open":float(x['mid']['o']),"High":float(x['mid']['h']),
+                "Low":float(x['mid']['l']),"Close":float(x['mid']['c']),
+                "Open Bid":float(x['bid']['o']),"High Bid":float(x['bid']['h']),
+                "Low Bid":float(x['bid']['l']),"Close Bid":float(x['bid']['c']),
+                "Open Ask":float(x['ask']['o']),"High Ask":float(x['ask']['h']),
+                "Low Ask":float(x['ask']['l']),"Close Ask":float(x['ask']['c']),
+                "Volume":float(x['volume']),"Complete":x['complete']} for x in candles]
+
+    df = pd.DataFrame(results)
+    df['Time'] = pd.to_datetime(df.Time, format="%Y-%m-%dT%H:%M:%S.%fZ")
+
+    return df
+
+def bench_parse(fixtures, repeats, recorded = None):
+    '''
+    parse_candles of one page and of a full 5000 candle page, mid and mid/bid/ask, against the per candle parsing
+    '''
+    results = {}
+
+    for MBA_candles in (False, True):
+        for n in (500, 5000):
+            candles = fixtures.candles(n, 'M5', MBA_candles)
+            name = f"parse_candles {'MBA' if MBA_candles else 'M'} {n}"
+            results[name] = measure(lambda: parse_candles(candles, MBA_candles), repeats * 4, rows=n)
+            results[name + ' per candle (reference)'] = measure(lambda: parse_per_candle(candles, MBA_candles), repeats * 4, rows=n)
+
+    if recorded is not None:
+        candles = load_recorded(recorded)
+        MBA_candles = 'bid' in candles[0]
+        results['parse_candles recorded'] = measure(lambda: parse_candles(candles, MBA_candles), repeats * 4, rows=len(candles))
+
+    return results
+
+def bench_extract(fixtures, repeats, n = 100000):
+    '''
+    OandaHistoricCandles.extract_candles replaying a paged history - JSON decode, parse, qc, concat - sequential and
+    with parallel windows, float64 and compact dtype policies
+    '''
+    results = {}
+
+    for MBA_candles, max_workers, dtype_policy in ((False, 1, 'float64'), (True, 1, 'float64'), (True, 4, 'float64'),
+                                                   (True, 1, 'float32'), (True, 1, 'pips')):
+        client = fixtures.client(n, 'M5', MBA_candles)
+        start_date, end_date = fixture_dates(fixtures.candles(n, 'M5', MBA_candles), 'M5')
+
+        def extract():
+            reader = OandaHistoricCandles('USD', 'EUR', 'M5', MBA_candles, start_date, end_date,
+                                          max_workers=max_workers, client=client, dtype_policy=dtype_policy)
+            return reader.extract_candles()
+
+        name = f"extract_candles {'MBA' if MBA_candles else 'M'} {n} workers={max_workers} {dtype_policy}"
+        results[name] = measure(extract, repeats, rows=n)
+
+    return results
+
+def concat_per_loop(chunks):
+    '''
+    (list of pandas dataframes)->(pandas dataframe)
+    Reference copy of the extract_candles loop before the single concat - every pass concatenates the dataset read so
+    far with the new chunk, copying the whole history each time
+    '''
+    dataset = pd.DataFrame()
+
+    for df in chunks:
+        if dataset.empty:
+            dataset = df.copy()
+        else:
+            dataset = pd.concat([dataset, df])
+
+    return dataset
+
+def bench_concat(fixtures, repeats, n = 1000000, chunk_size = 5000):
+    '''
+    concat_dataset of a 1M candle mid/bid/ask history in pages of chunk_size candles, against the per loop concat
+    '''
+    base = fixtures.frame(250000, 'M1', True)
+    df = pd.concat([base] * (n // len(base)))
+    df.index = pd.date_range('2023-01-02', periods=len(df), freq='min', name='Time')
+    chunks = [df.iloc[i:i + chunk_size] for i in range(0, len(df), chunk_size)]
+
+    reader = OandaHistoricCandles('USD', 'EUR', 'M1', True, '2023-01-02', '2023-01-03', client=object())
+
+    return {f"concat_dataset MBA {n} single concat": measure(lambda: reader.concat_dataset(chunks), repeats, rows=n),
+            f"concat_dataset MBA {n} per loop concat (reference)": measure(lambda: concat_per_loop(chunks), 1, rows=n, warmup=0)}
+
+def bench_resample(fixtures, repeats, n = 250000):
+    '''
+    resample_candles of a mid/bid/ask S5 history to M1, H1 and D
+    '''
+    df = fixtures.frame(n, 'S5', True)
+    results = {}
+
+    for time_interval in ('M1', 'H1', 'D'):
+        results[f"resample_candles MBA {n} S5->{time_interval}"] = measure(
+            lambda: resample_candles(df, time_interval, 'S5'), repeats, rows=n)
+
+    return results
+
+def bench_qc(fixtures, repeats, n = 250000):
+    '''
+    candle_qc of a mid/bid/ask M1 history
+    '''
+    df = fixtures.frame(n, 'M1', True)
+
+    return {f"candle_qc MBA {n} M1": measure(lambda: candle_qc(df, 'M1'), repeats, rows=n)}
+
+def bench_compact(fixtures, repeats, n = 250000):
+    '''
+    compact_candles of a mid/bid/ask history, latency and the resident size of the result per row
+    '''
+    df = fixtures.frame(n, 'M1', True).reset_index()
+    price_decimals = candle_price_decimals(df)
+    results = {}
+
+    for dtype_policy in ('float32', 'pips'):
+        result = measure(lambda: compact_candles(df, dtype_policy, price_decimals), repeats, rows=n)
+        result['bytes_per_row'] = compact_candles(df, dtype_policy, price_decimals).memory_usage(deep=True).sum() / n
+        results[f"compact_candles MBA {n} {dtype_policy}"] = result
+
+    results[f"compact_candles MBA {n} float64"] = {'bytes_per_row': df.memory_usage(deep=True).sum() / n}
+
+    return results
+
+def bench_columnar(fixtures, repeats, n = 250000):
+    '''
+    save_columnar and load_columnar (memory mapped and read into memory) of a mid/bid/ask history
+    '''
+    df = fixtures.frame(n, 'M1', True)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'candles')
+
+        results[f"save_columnar MBA {n}"] = measure(lambda: save_columnar(df, path), repeats, rows=n)
+        results[f"load_columnar MBA {n} mmap"] = measure(lambda: load_columnar(path), repeats * 4, rows=n)
+        results[f"load_columnar MBA {n} read"] = measure(lambda: load_columnar(path, mmap=False), repeats, rows=n)
+
+    return results
+
+def bench_yfinance(fixtures, repeats, rows = 2500, universe = 500):
+    '''
+    yfinance ticker and universe readers with yf.download replaced by a stub returning pre-built frames, so only the
+    reader's own validation, batching and splitting is measured
+    '''
+    download = yf.download
+    yf.download = stub_download(rows)
+    results = {}
+
+    try:
+        reader = yfinance_ticker_reader('AAPL')
+        results[f"yfinance ticker period {rows}"] = measure(
+            lambda: reader.read_ticker_pandas_period('10y', '1d'), repeats * 4, rows=rows)
+        results[f"yfinance ticker start_end {rows}"] = measure(
+            lambda: reader.read_ticker_pandas_start_end('2000-01-03', '2010-01-01', '1d'), repeats * 4, rows=rows)
+
+        tickers = [f"T{n:04d}" for n in range(universe)]
+        universe_reader = yfinance_universe_reader(tickers, batch_size=100)
+        results[f"yfinance universe period {universe}x{rows}"] = measure(
+            lambda: universe_reader.read_universe_pandas_period('10y', '1d'), repeats, rows=rows * universe)
+    finally:
+        yf.download = download
+
+    return results
+
+#modules a bare import trade_read must not load, the submodules import them on first use
+LAZY_MODULES = ('pandas', 'numpy', 'oandapyV20', 'yfinance', 'requests')
+
+#absolute import time ceilings in seconds, the only latency check of the imports. The submodules mostly time pandas,
+#oandapyV20 and yfinance, the ceilings only catch a gross regression such as importing every reader eagerly
+IMPORT_CEILINGS = {'import trade_read': 0.05,
+                   'import trade_read.yahoo_finance_read': 2.0,
+                   'import trade_read.oanda_read': 2.0}
+
+def import_time(module):
+    '''
+    (str)->(float, list of strings)
+    Import module in a fresh interpreter with -X importtime. Returns the cumulative import time of the module and its
+    parent packages in seconds, and the LAZY_MODULES loaded by the import
+    '''
+    statement = f"import sys, {module}; print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], capture_output=True, text=True, check=True)
+
+    parts = module.split('.')
+    targets = {'.'.join(parts[:n]) for n in range(1, len(parts) + 1)}
+    microseconds = 0
+    for line in process.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() in targets and fields[1].strip().isdigit():
+            microseconds += int(fields[1])
+
+    loaded = [name for name in process.stdout.strip().split(',') if name]
+
+    return microseconds / 1e6, loaded
+
+def bench_import(fixtures, repeats):
+    '''
+    Cumulative import time (-X importtime) of the package and its reader modules in a fresh interpreter, and the heavy
+    dependencies each import loads. import trade_read must stay lazy, see LAZY_MODULES and IMPORT_CEILINGS
+    '''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = {}
+
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        for module in ('trade_read', 'trade_read.yahoo_finance_read', 'trade_read.oanda_read'):
+            name = f"import {module}"
+            import_time(module)
+            runs = [import_time(module) for _ in range(repeats)]
+            results[name] = {**percentiles([seconds for seconds, loaded in runs]), 'rows': None, 'rows_per_second': None,
+                             'peak_mib': None, 'repeats': repeats, 'loaded': runs[-1][1],
+                             'ceiling': IMPORT_CEILINGS[name], 'absolute_only': True}
+            if module == 'trade_read':
+                results[name]['forbidden'] = [m for m in runs[-1][1] if m in LAZY_MODULES]
+    finally:
+        os.chdir(cwd)
+
+    return results
+
+
+BENCHMARKS = [bench_parse, bench_extract, bench_concat, bench_resample, bench_qc, bench_compact, bench_columnar, bench_yfinance,
+              bench_import]
+
+
+def run_benchmarks(repeats = 5, name_filter = None, recorded = None):
+    '''
+    (int, str, str)->(dictionary)
+    Run every benchmark group, or only the groups whose function name contains name_filter
+    '''
+    fixtures = fixture_cache()
+    results = {}
+
+    for bench in BENCHMARKS:
+        if name_filter is not None and name_filter not in bench.__name__:
+            continue
+        kwargs = {'recorded': recorded} if bench is bench_parse else {}
+        results.update(bench(fixtures, repeats, **kwargs))
+
+    return results
+
+def machine_info():
+    '''
+    ()->(dictionary)
+    Interpreter, library versions and machine of a run, stored with the baseline
+    '''
+    return {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'yfinance': yf.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count()}
+
+def print_results(results, baseline = None):
+    '''
+    (dictionary, dictionary)->(None)
+    Print one line per benchmark, with the p50 ratio to the baseline when given
+    '''
+    print(f"{'benchmark':<52}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'rows/s':>14}{'peak MiB':>10}{'B/row':>8}{'vs base':>9}")
+
+    for name, result in results.items():
+        def cell(key, scale = 1.0, fmt = '.2f'):
+            value = result.get(key)
+            return '-' if value is None else format(value * scale, fmt)
+
+        ratio = '-'
+        if baseline is not None and baseline.get(name, {}).get('p50'):
+            ratio = f"{result['p50'] / baseline[name]['p50']:.2f}x" if result.get('p50') is not None else '-'
+
+        print(f"{name:<52}{cell('p50', 1e3):>10}{cell('p90', 1e3):>10}{cell('p99', 1e3):>10}"
+              f"{cell('rows_per_second', 1.0, ',.0f'):>14}{cell('peak_mib'):>10}{cell('bytes_per_row', 1.0, '.1f'):>8}{ratio:>9}")
+
+def compare(results, baseline, threshold = DEFAULT_THRESHOLD):
+    '''
+    (dictionary, dictionary, float)->(list of strings)
+    Return a description of every benchmark whose p50 latency, peak memory or bytes per row exceeds its baseline by
+    more than threshold, is over its absolute ceiling or loads a forbidden module. Latencies under MIN_COMPARE_SECONDS
+    in the baseline, reference implementations and absolute_only results (the imports) are not compared against the
+    baseline.
+    '''
+    regressions = []
+
+    for name, result in results.items():
+        #absolute limits hold with or without a baseline
+        if result.get('ceiling') is not None and result['p50'] > result['ceiling']:
+            regressions.append(f"{name}: p50 {result['p50'] * 1e3:.2f} ms over the {result['ceiling'] * 1e3:.0f} ms ceiling")
+        if result.get('forbidden'):
+            regressions.append(f"{name}: loads {', '.join(result['forbidden'])}, the import is no longer lazy")
+
+        base = baseline.get(name)
+        #reference implementations are reported for comparison only, they are not package code
+        if base is None or name.endswith('(reference)') or result.get('absolute_only'):
+            continue
+
+        if result.get('p50') is not None and base.get('p50') and base['p50'] >= MIN_COMPARE_SECONDS:
+            if result['p50'] > base['p50'] * threshold:
+                regressions.append(f"{name}: p50 {result['p50'] * 1e3:.2f} ms vs baseline {base['p50'] * 1e3:.2f} ms")
+
+        for key, unit in (('peak_mib', 'MiB'), ('bytes_per_row', 'B/row')):
+            if result.get(key) is not None and base.get(key) and result[key] > base[key] * threshold:
+                regressions.append(f"{name}: {key} {result[key]:.2f} {unit} vs baseline {base[key]:.2f} {unit}")
+
+    return regressions
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description='Offline benchmarks of the trade_read readers')
+    parser.add_argument('--filter', default=None, help='only run benchmarks whose group name contains this string')
+    parser.add_argument('--quick', action='store_true', help='fewer repeats')
+    parser.add_argument('--repeats', type=int, default=None, help='timed repeats per benchmark. Default 5, 2 with --quick')
+    parser.add_argument('--recorded', default=None, help='recorded InstrumentsCandles JSON response to parse')
+    parser.add_argument('--output', default=None, help='write the results as JSON to this file')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline file. Default benchmarks/baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results to the baseline file')
+    parser.add_argument('--compare', action='store_true',
+                        help='compare with the baseline, exit 1 on a regression. The baseline must be recorded on this machine')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'regression factor for --compare. Default {DEFAULT_THRESHOLD}')
+    args = parser.parse_args(argv)
+
+    repeats = args.repeats if args.repeats is not None else (2 if args.quick else 5)
+
+    baseline = None
+    if args.compare:
+        with open(args.baseline) as f:
+            recorded_baseline = json.load(f)
+        baseline = recorded_baseline['results']
+        if recorded_baseline.get('machine') != machine_info():
+            print(f"WARNING {args.baseline} was recorded on another machine or library versions, re-record it with "
+                  f"--save-baseline from the unchanged code before comparing. Baseline {recorded_baseline.get('machine')}")
+
+    results = run_benchmarks(repeats, args.filter, args.recorded)
+    print_results(results, baseline)
+
+    document = {'machine': machine_info(), 'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'results': results}
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=1)
+
+    if args.save_baseline:
+        #a filtered run only replaces its own results in an existing baseline
+        if args.filter is not None and os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                document['results'] = {**json.load(f)['results'], **results}
+        with open(args.baseline, 'w') as f:
+            json.dump(document, f, indent=1)
+        print(f"baseline written to {args.baseline}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            return 1
+        print(f"no regressions over {args.threshold:.2f}x of the baseline")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
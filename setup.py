@@ -33,6 +33,8 @@ setup(
     license='MIT',
     author_email='kevin.jaggs@gmail.com',
     install_requires=[required],
+    extras_require={'async': ['aiohttp']},
+    entry_points={'console_scripts': ['trade-read-backfill=trade_read.oanda_backfill:main']},
     #keywords='python git setup example',
     classifiers=[
         'Intended Audience :: Developers',
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Write the InstrumentsCandles responses used by tests/test_resample.py
+
+python tests/fixtures/make_resample_fixtures.py            rebuild the committed synthetic responses
+python tests/fixtures/make_resample_fixtures.py --record   record the same ranges from the Oanda API, needs OANDA_API_KEY
+
+The synthetic M5 responses are a seeded random walk. Their H1, H4 and D responses are aggregated with pandas
+resample - independent of resample_candles - following the Oanda alignment (UTC, dailyAlignment 0): bins without
+candles are not returned and a candle is complete only if all of its M5 candles are.
+"""
+
+
+###########################################
+#import libraries
+import argparse
+import json
+import os
+import sys
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from benchmarks.fixtures import synthetic_candles
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'candles')
+
+#name -> (instrument, price, from, to, M5 candles, trailing candle incomplete)
+CASES = {'weekend': ('EUR_USD', 'M', '2023-01-05', '2023-01-10', 1152, False),
+         'incomplete': ('EUR_USD', 'MBA', '2023-01-10', '2023-01-11', 250, True)}
+
+GRANULARITIES = {'H1': '1H', 'H4': '4H', 'D': '1D'}
+
+BLOCKS = ('mid', 'bid', 'ask')
+
+
+def fixture_path(case, granularity):
+
+    return os.path.join(FIXTURE_DIR, f"{case}_{granularity}.json")
+
+def aggregate(candles, rule):
+    '''
+    (list of dictionaries, str)->(list of dictionaries)
+    Aggregate M5 candles into pandas resample bins of rule, as the API returns them
+    '''
+    rows = []
+    for candle in candles:
+        row = {'time': pd.Timestamp(candle['time'][:19]), 'volume': candle['volume'], 'complete': candle['complete']}
+        for block in BLOCKS:
+            if block in candle:
+                for key in 'ohlc':
+                    row[f"{block} {key}"] = candle[block][key]
+        rows.append(row)
+
+    df = pd.DataFrame(rows).set_index('time')
+    blocks = [block for block in BLOCKS if f"{block} o" in df.columns]
+
+    #string prices keep the 5 decimal quotes, compare them as floats for high and low
+    grouped = df.resample(rule, label='left', closed='left')
+    result = []
+    for start, bin_df in grouped:
+        if bin_df.empty:
+            continue
+        candle = {'complete': bool(bin_df['complete'].all()), 'volume': int(bin_df['volume'].sum()),
+                  'time': start.strftime('%Y-%m-%dT%H:%M:%S.000000000Z')}
+        for block in blocks:
+            candle[block] = {'o': bin_df[f"{block} o"].iloc[0],
+                             'h': max(bin_df[f"{block} h"], key=float),
+                             'l': min(bin_df[f"{block} l"], key=float),
+                             'c': bin_df[f"{block} c"].iloc[-1]}
+        result.append(candle)
+
+    return result
+
+def synthetic():
+
+    for case, (instrument, price, start, end, n, incomplete) in CASES.items():
+        candles = synthetic_candles(n, 'M5', price == 'MBA', start=int(pd.Timestamp(start).timestamp()), seed=len(case))
+        candles = [candle for candle in candles if candle['time'] < end]
+        for candle in candles:
+            candle['complete'] = True
+        candles[-1]['complete'] = not incomplete
+
+        responses = {'M5': candles}
+        for granularity, rule in GRANULARITIES.items():
+            responses[granularity] = aggregate(candles, rule)
+
+        for granularity, response in responses.items():
+            with open(fixture_path(case, granularity), 'w') as f:
+                json.dump({'instrument': instrument, 'granularity': granularity, 'candles': response}, f, indent=0)
+
+def record():
+
+    import oandapyV20.endpoints.instruments as instruments
+    from trade_read.oanda_client import shared_client
+
+    client = shared_client()
+
+    for case, (instrument, price, start, end, n, incomplete) in CASES.items():
+        for granularity in ['M5'] + list(GRANULARITIES):
+            params = {'from': start + 'T00:00:00Z', 'to': end + 'T00:00:00Z', 'price': price, 'granularity': granularity,
+                      'alignmentTimezone': 'UTC', 'dailyAlignment': 0}
+            r = instruments.InstrumentsCandles(instrument=instrument, params=params)
+            with open(fixture_path(case, granularity), 'w') as f:
+                json.dump(client.request(r), f, indent=0)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Write the resample test fixtures')
+    parser.add_argument('--record', action='store_true', help='record from the Oanda API instead')
+    args = parser.parse_args()
+
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    record() if args.record else synthetic()
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import threading
+import time
+import pandas as pd
+import pytest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+from urllib.parse import urlsplit, parse_qsl
+from benchmarks.fixtures import synthetic_candles, FixtureClient
+from trade_read.oanda_read import OandaHistoricCandles
+from trade_read.async_read import AsyncOandaClient, AsyncOandaHistoricCandles
+
+
+class CandleHandler(BaseHTTPRequestHandler):
+    '''
+    Stub of the Oanda candles endpoint, serving the server's FixtureClient history. The first throttle requests are
+    answered with a 429 and a Retry-After header
+    '''
+
+    def do_GET(self):
+
+        url = urlsplit(self.path)
+        if not url.path.endswith('/candles'):
+            self.send_error(404)
+            return
+
+        with self.server.lock:
+            throttled = self.server.throttle > 0
+            self.server.throttle -= throttled
+            self.server.requests.append((time.monotonic(), throttled))
+
+        if throttled:
+            body = b'{"errorMessage": "Rate limit exceeded"}'
+            self.send_response(429)
+            self.send_header('Retry-After', str(self.server.retry_after))
+        else:
+            body = json.dumps(self.server.candles.request(SimpleNamespace(params=dict(parse_qsl(url.query))))).encode()
+            self.send_response(200)
+
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def server():
+
+    candles = synthetic_candles(30000, 'M5', True)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CandleHandler)
+    server.candles = FixtureClient(candles)
+    server.fixture = candles
+    server.lock = threading.Lock()
+    server.requests = []
+    server.throttle = 0
+    server.retry_after = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+async def extract(server, **kwargs):
+
+    client = AsyncOandaClient('test', base_url=f"http://127.0.0.1:{server.server_port}")
+    try:
+        reader = AsyncOandaHistoricCandles('USD', 'EUR', 'M5', True, '2023-01-02', '2023-04-01', client=client, **kwargs)
+        return await reader.extract_candles()
+    finally:
+        await client.close()
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_async_matches_sync(server, max_workers):
+
+    expected = OandaHistoricCandles('USD', 'EUR', 'M5', True, '2023-01-02', '2023-04-01',
+                                    client=FixtureClient(server.fixture), max_workers=max_workers).extract_candles()
+
+    df = asyncio.run(extract(server, max_workers=max_workers))
+
+    pd.testing.assert_frame_equal(df, expected)
+
+def test_retry_after(server):
+
+    server.throttle = 2
+    server.retry_after = 0.3
+    del server.requests[:]
+
+    df = asyncio.run(extract(server, retry_backoff=0.001))
+
+    client = FixtureClient(server.fixture)
+    expected = OandaHistoricCandles('USD', 'EUR', 'M5', True, '2023-01-02', '2023-04-01', client=client).extract_candles()
+
+    #two throttled responses, each waited out for Retry-After instead of the 1 ms backoff
+    times, throttled = zip(*server.requests)
+    assert throttled == (True, True) + (False,) * client.requests
+    assert times[1] - times[0] >= 0.29 and times[2] - times[1] >= 0.29
+    pd.testing.assert_frame_equal(df, expected)
@@ -0,0 +1,120 @@
+import functools
+import json
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from oandapyV20.exceptions import V20Error
+from benchmarks.fixtures import synthetic_candles, FixtureClient
+from trade_read.oanda_backfill import OandaBackfill, main
+from trade_read.oanda_read import OandaHistoricCandles, CANDLE_PRICE_COLUMNS
+
+
+#built at import, worker processes forked by the backfill share it
+CANDLES = synthetic_candles(40000, 'M5')
+
+#the 30 day slices since 1970-01-01 covering the range start on 2022-12-24, 2023-01-23, 2023-02-22 and 2023-03-24
+START, END = '2023-01-02', '2023-04-01'
+FAIL_FROM = pd.Timestamp('2023-02-22').timestamp()
+
+
+class FailingClient(FixtureClient):
+    '''
+    FixtureClient answering every request from fail_from onwards with a 400, which the readers do not retry
+    '''
+
+    def __init__(self, candles = None, fail_from = None):
+
+        super().__init__(candles)
+        self.fail_from = fail_from
+
+    def request(self, endpoint):
+
+        if self.fail_from is not None and float(endpoint.params['from']) >= self.fail_from:
+            raise V20Error(400, '{"errorMessage": "stub"}')
+
+        return super().request(endpoint)
+
+def client_factory(fail_from = None):
+    return FailingClient(CANDLES, fail_from)
+
+def backfill(root, fail_from = None, **kwargs):
+    return OandaBackfill([('USD', 'EUR')], ['M5'], False, START, END, str(root), processes=2,
+                         client_factory=functools.partial(client_factory, fail_from), **kwargs)
+
+def manifest(root):
+    with open(os.path.join(root, 'manifest.json')) as f:
+        return json.load(f)['tasks']
+
+
+def test_resume_after_failed_slices(tmp_path):
+
+    summary = backfill(tmp_path, FAIL_FROM).run()
+
+    assert summary['done'] == 2
+    assert summary['failed'] == 2
+    tasks = manifest(tmp_path)
+    assert all('V20Error' in task['error'] for task in tasks.values() if task['status'] == 'failed')
+
+    #the done slices are not downloaded again, the failed ones are retried
+    done = {os.path.join(root, name): os.path.getmtime(os.path.join(root, name))
+            for root, dirs, files in os.walk(tmp_path) for name in files if name != 'manifest.json'}
+    assert done
+    summary = backfill(tmp_path).run()
+
+    assert summary['done'] == 4
+    assert summary['failed'] == 0
+    tasks = manifest(tmp_path)
+    assert sorted(task['attempts'] for task in tasks.values()) == [1, 1, 2, 2]
+    assert all(os.path.getmtime(path) == mtime for path, mtime in done.items())
+
+    #slices joined back match a single read of the whole range
+    df = backfill(tmp_path).load_slices('USD', 'EUR', 'M5')
+    expected = OandaHistoricCandles('USD', 'EUR', 'M5', False, START, END, client=FixtureClient(CANDLES)).extract_candles()
+
+    columns = CANDLE_PRICE_COLUMNS['mid'] + ['Volume', 'Complete']
+    assert df.index.equals(expected.index)
+    np.testing.assert_array_equal(df[columns].values, expected[columns].values)
+
+    #nothing left to do
+    assert backfill(tmp_path).run() == summary
+
+def test_deleted_slice_is_downloaded_again(tmp_path):
+
+    backfill(tmp_path).run()
+    slices = sorted(os.listdir(os.path.join(tmp_path, 'EUR_USD_M5_M')))
+    path = os.path.join(tmp_path, 'EUR_USD_M5_M', slices[1])
+    for name in os.listdir(path):
+        os.remove(os.path.join(path, name))
+    os.rmdir(path)
+
+    summary = backfill(tmp_path).run()
+
+    assert summary['done'] == 4
+    assert sorted(task['attempts'] for task in manifest(tmp_path).values()) == [1, 1, 1, 2]
+
+def test_manifest_settings_must_match(tmp_path):
+
+    backfill(tmp_path).run()
+
+    with pytest.raises(ValueError, match='dtype_policy'):
+        backfill(tmp_path, dtype_policy='float32').run()
+
+    #pips slices must share one scale per instrument
+    with pytest.raises(ValueError, match='price decimals'):
+        backfill(tmp_path / 'pips', dtype_policy='pips')
+
+    pips = backfill(tmp_path / 'pips', dtype_policy='pips', price_decimals={'EUR_USD': 5})
+    assert pips.run()['done'] == 4
+    assert (pips.load_slices('USD', 'EUR', 'M5')[CANDLE_PRICE_COLUMNS['mid']].dtypes == 'int32').all()
+
+    with pytest.raises(ValueError, match='price_decimals'):
+        backfill(tmp_path / 'pips', dtype_policy='pips', price_decimals={'EUR_USD': 4}).run()
+
+def test_cli_status(tmp_path, capsys):
+
+    backfill(tmp_path, FAIL_FROM).run()
+
+    assert main([str(tmp_path), '--instruments', 'EUR_USD', '--granularities', 'M5', '--start', START, '--end', END,
+                 '--status']) == 1
+    assert capsys.readouterr().out.split() == ['pending=0', 'done=2', 'open=0', 'failed=2']
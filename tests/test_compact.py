@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.fixtures import synthetic_candles, FixtureClient
+from trade_read.oanda_read import (OandaHistoricCandles, OandaRecentCandles, compact_candles, expand_candles,
+                                   CANDLE_PRICE_COLUMNS)
+
+
+PRICE_COLUMNS = [name for block in CANDLE_PRICE_COLUMNS for name in CANDLE_PRICE_COLUMNS[block]]
+
+
+def four_decimal_start(candles, n):
+    '''
+    Quote the first n candles to 4 decimals, as a quiet first page could be
+    '''
+    for candle in candles[:n]:
+        for block in CANDLE_PRICE_COLUMNS:
+            candle[block] = {key: f"{float(value):.4f}" for key, value in candle[block].items()}
+
+    return candles
+
+
+@pytest.mark.parametrize('dtype_policy', ['float64', 'float32', 'pips'])
+def test_weekend_only_range(dtype_policy):
+
+    client = FixtureClient(synthetic_candles(5000, 'M5', True))
+
+    #2023-01-07 is a Saturday, the market is closed for the whole range
+    reader = OandaHistoricCandles('USD', 'EUR', 'M5', True, '2023-01-07', '2023-01-08', client=client,
+                                  dtype_policy=dtype_policy)
+    df = reader.extract_candles()
+
+    assert df.empty
+    if dtype_policy != 'float64':
+        assert (df[PRICE_COLUMNS].dtypes == ('int32' if dtype_policy == 'pips' else 'float32')).all()
+
+
+def test_recent_candles_empty_response():
+
+    reader = OandaRecentCandles('USD', 'EUR', 'M5', True, 100, client=FixtureClient([]), dtype_policy='pips')
+    df = reader.get_candles()
+
+    assert df.empty
+    assert (df[PRICE_COLUMNS].dtypes == 'int32').all()
+
+
+@pytest.mark.parametrize('dtype_policy', ['float32', 'pips'])
+def test_compact_round_trip(dtype_policy):
+
+    client = FixtureClient(synthetic_candles(20000, 'M5', True))
+    df = OandaHistoricCandles('USD', 'EUR', 'M5', True, '2023-01-02', '2023-03-01', client=client).extract_candles()
+
+    compact = OandaHistoricCandles('USD', 'EUR', 'M5', True, '2023-01-02', '2023-03-01', client=client,
+                                   dtype_policy=dtype_policy).extract_candles()
+
+    assert compact.memory_usage(deep=True).sum() < df.memory_usage(deep=True).sum()
+    restored = expand_candles(compact, 5)
+    np.testing.assert_array_equal(restored[PRICE_COLUMNS].values, df[PRICE_COLUMNS].values)
+    np.testing.assert_array_equal(restored['Volume'].values, df['Volume'].values)
+    assert compact.index.equals(df.index)
+
+
+def test_pips_later_chunk_with_more_decimals():
+
+    candles = four_decimal_start(synthetic_candles(20000, 'M5', True), 5000)
+    client = FixtureClient(candles)
+
+    #the scale inferred from the first page does not fit the later pages
+    reader = OandaHistoricCandles('USD', 'EUR', 'M5', True, '2023-01-02', '2023-03-01', client=client,
+                                  dtype_policy='pips')
+    with pytest.raises(ValueError, match='decimals'):
+        reader.extract_candles()
+
+    #an explicit scale is exact over the whole range
+    df = OandaHistoricCandles('USD', 'EUR', 'M5', True, '2023-01-02', '2023-03-01', client=client).extract_candles()
+    compact = OandaHistoricCandles('USD', 'EUR', 'M5', True, '2023-01-02', '2023-03-01', client=client,
+                                   dtype_policy='pips', price_decimals=5).extract_candles()
+
+    pd.testing.assert_frame_equal(expand_candles(compact, 5)[PRICE_COLUMNS], df[PRICE_COLUMNS])
+
+
+def test_compact_candles_out_of_range():
+
+    df = pd.DataFrame({'Open': [1.5], 'High': [30000.0], 'Low': [1.0], 'Close': [1.2]})
+
+    with pytest.raises(ValueError, match='int32'):
+        compact_candles(df, 'pips', 5)
+    with pytest.raises(ValueError, match='required'):
+        compact_candles(df, 'pips')
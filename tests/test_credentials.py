@@ -0,0 +1,19 @@
+import pytest
+import trade_read.oanda_read as oanda_read
+
+
+def test_missing_api_key_is_an_attribute_error(monkeypatch):
+
+    monkeypatch.delenv('OANDA_API_KEY', raising=False)
+
+    assert not hasattr(oanda_read, 'api_key')
+    assert getattr(oanda_read, 'api_key', None) is None
+    with pytest.raises(AttributeError, match='OANDA_API_KEY') as ex:
+        oanda_read.api_key
+    assert isinstance(ex.value.__cause__, KeyError)
+
+def test_api_key_from_environment(monkeypatch):
+
+    monkeypatch.setenv('OANDA_API_KEY', "'abc-123'")
+
+    assert oanda_read.api_key == 'abc-123'
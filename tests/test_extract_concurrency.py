@@ -0,0 +1,52 @@
+import time
+import pandas as pd
+import pytest
+from benchmarks.fixtures import synthetic_candles, FixtureClient
+from trade_read.oanda_read import OandaHistoricCandles
+
+
+class LatencyClient(FixtureClient):
+    """
+    FixtureClient that sleeps for a fixed network latency on every request, about the time Oanda takes to serve a
+    page of 5000 candles. The sleep releases the GIL like a real socket wait
+    """
+
+    def __init__(self, candles = None, latency = 0.3):
+
+        super().__init__(candles)
+        self.latency = latency
+
+    def request(self, endpoint):
+
+        time.sleep(self.latency)
+        return super().request(endpoint)
+
+
+@pytest.fixture(scope='module')
+def client():
+
+    return LatencyClient(synthetic_candles(40000, 'M5'))
+
+
+def extract(client, max_workers):
+
+    reader = OandaHistoricCandles('USD', 'EUR', 'M5', False, '2023-01-02', '2023-07-01', client=client, max_workers=max_workers)
+
+    start = time.perf_counter()
+    df = reader.extract_candles()
+
+    return df, time.perf_counter() - start
+
+
+def test_wall_time_falls_with_workers(client):
+
+    sequential, sequential_time = extract(client, 1)
+    two, two_time = extract(client, 2)
+    four, four_time = extract(client, 4)
+
+    assert two_time < sequential_time
+    assert four_time < two_time
+    assert four_time < sequential_time * 0.75
+
+    pd.testing.assert_frame_equal(sequential, two)
+    pd.testing.assert_frame_equal(sequential, four)
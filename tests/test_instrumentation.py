@@ -0,0 +1,52 @@
+import datetime
+import io
+import requests
+from trade_read.instrumentation import Instrumentation, instrumentation_hook
+
+
+def response(body, headers = None):
+    '''
+    Unread requests response with body as its raw stream
+    '''
+    r = requests.Response()
+    r.status_code = 200
+    r.raw = io.BytesIO(body)
+    r.headers.update(headers or {})
+    r.elapsed = datetime.timedelta(seconds=0.01)
+
+    return r
+
+
+def test_response_body_is_counted():
+
+    instrumentation = Instrumentation()
+    with instrumentation.stage('request'):
+        instrumentation_hook(response(b'{"candles": []}'), stream=False)
+
+    assert instrumentation.counters['bytes'] == 15
+    assert instrumentation.timers['http'][1] == 1
+
+def test_streamed_response_is_not_read():
+
+    instrumentation = Instrumentation()
+    stream = response(b'{"type": "HEARTBEAT"}\n' * 3)
+    with instrumentation.stage('request'):
+        instrumentation_hook(stream, stream=True)
+
+    #the caller still reads the whole stream
+    assert stream.raw.tell() == 0
+    assert len(list(stream.iter_lines())) == 3
+    assert 'bytes' not in instrumentation.counters
+    assert instrumentation.timers['http'][1] == 1
+
+    with instrumentation.stage('request'):
+        instrumentation_hook(response(b'{}', {'Content-Length': '2'}), stream=True)
+
+    assert instrumentation.counters['bytes'] == 2
+
+def test_no_active_stage():
+
+    instrumentation = Instrumentation()
+    instrumentation_hook(response(b'{}'), stream=False)
+
+    assert instrumentation.counters == {}
@@ -0,0 +1,31 @@
+import math
+import pandas as pd
+import pytest
+from benchmarks.fixtures import synthetic_candles, FixtureClient
+from trade_read.oanda_read import OandaHistoricCandles, oanda_granularity_seconds
+
+
+#(granularity, candles, start date, end date), every range spans several weekends
+RANGES = [('M5', 30000, '2023-01-02', '2023-05-01'),
+          ('M1', 30000, '2023-01-02', '2023-02-08'),
+          ('S5', 30000, '2023-01-02', '2023-01-05')]
+
+
+@pytest.mark.parametrize('granularity, n, start_date, end_date', RANGES)
+def test_count_paging_across_weekend_gaps(granularity, n, start_date, end_date):
+
+    client = FixtureClient(synthetic_candles(n, granularity, True, weekends=True))
+
+    sequential = OandaHistoricCandles('USD', 'EUR', granularity, True, start_date, end_date, client=client)
+    df = sequential.extract_candles()
+    requests = client.requests
+
+    #the old paging requested fixed from/to windows of 999 nominal candles
+    old_requests = math.ceil((sequential.end_date - sequential.start_date) / (999 * oanda_granularity_seconds()[granularity]))
+
+    assert requests < old_requests
+    assert not df.index.duplicated().any()
+    assert df.index.is_monotonic_increasing
+
+    parallel = OandaHistoricCandles('USD', 'EUR', granularity, True, start_date, end_date, client=client, max_workers=4)
+    pd.testing.assert_frame_equal(df, parallel.extract_candles())
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.fixtures import synthetic_candles, FixtureClient
+from trade_read.oanda_read import OandaHistoricCandles, candle_qc
+
+
+@pytest.fixture(scope='module')
+def dataset():
+
+    #M5 from Monday 2023-01-02 over the weekends of 2023-01-07 and 2023-01-14
+    client = FixtureClient(synthetic_candles(10000, 'M5', True))
+    reader = OandaHistoricCandles('USD', 'EUR', 'M5', True, '2023-01-02', '2023-01-20', client=client)
+    reader.extract_candles()
+
+    return reader
+
+def flagged(mask):
+    return np.flatnonzero(mask).tolist()
+
+
+def test_clean_dataset(dataset):
+
+    report = dataset.candle_check()
+
+    assert report['rows'] == len(dataset.dataset)
+    assert report['weekend_gaps'] == 2
+    assert report['gaps'] == report['missing_candles'] == 0
+    assert report['duplicates'] == report['non_monotonic'] == 0
+    assert report['ohlc_errors'] == report['bid_ask_crossed'] == 0
+    assert report['flagged_rows'] == 0
+    assert not dataset.qc_mask.any()
+
+def test_duplicates(dataset):
+
+    df = dataset.dataset
+    df = pd.concat([df.iloc[:101], df.iloc[[100]], df.iloc[101:]])
+    report, mask = candle_qc(df, 'M5')
+
+    assert report['duplicates'] == 1
+    assert report['non_monotonic'] == 0
+    assert flagged(mask) == [101]
+
+def test_out_of_order(dataset):
+
+    df = dataset.dataset
+    df = df.iloc[np.r_[0:200, 201, 200, 202:len(df)]]
+    report, mask = candle_qc(df, 'M5')
+
+    assert report['non_monotonic'] == 1
+    assert report['duplicates'] == 0
+    assert 201 in flagged(mask)
+
+def test_ohlc_violation(dataset):
+
+    df = dataset.dataset.copy()
+    df.iloc[300, df.columns.get_loc('High')] = df['Open'].iloc[300] - 0.001
+    report, mask = candle_qc(df, 'M5')
+
+    assert report['ohlc_errors'] == 1
+    assert report['bid_ask_crossed'] == 0
+    assert flagged(mask) == [300]
+
+def test_bid_ask_crossed(dataset):
+
+    df = dataset.dataset.copy()
+    df.iloc[400, df.columns.get_loc('Close Bid')] = df['Close Ask'].iloc[400] + 0.0001
+    df.iloc[400, df.columns.get_loc('High Bid')] = df['Close Bid'].iloc[400]
+    report, mask = candle_qc(df, 'M5')
+
+    assert report['bid_ask_crossed'] == 1
+    assert report['ohlc_errors'] == 0
+    assert flagged(mask) == [400]
+
+def test_mid_week_gap_against_weekend_gap(dataset):
+
+    #ten candles missing on Tuesday 2023-01-03 afternoon
+    df = dataset.dataset.drop(dataset.dataset.index[500:510])
+    report, mask = candle_qc(df, 'M5')
+
+    assert report['gaps'] == 1
+    assert report['missing_candles'] == 10
+    assert report['weekend_gaps'] == 2
+    assert flagged(mask) == [500]
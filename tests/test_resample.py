@@ -0,0 +1,60 @@
+import json
+import os
+import pandas as pd
+import pytest
+from benchmarks.fixtures import FixtureClient
+from trade_read.oanda_read import OandaHistoricCandles
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'candles')
+
+#case -> (MBA candles, start date, end date), see tests/fixtures/make_resample_fixtures.py
+CASES = {'weekend': (False, '2023-01-05', '2023-01-10'),
+         'incomplete': (True, '2023-01-10', '2023-01-11')}
+
+COMPARED = ['Open', 'High', 'Low', 'Close', 'Open Bid', 'High Bid', 'Low Bid', 'Close Bid',
+            'Open Ask', 'High Ask', 'Low Ask', 'Close Ask', 'Volume', 'Complete']
+
+
+class GranularityClient():
+    """
+    Replays the recorded response of each granularity of a case
+    """
+
+    def __init__(self, case):
+
+        self.clients = {}
+        for granularity in ('M5', 'H1', 'H4', 'D'):
+            with open(os.path.join(FIXTURE_DIR, f"{case}_{granularity}.json")) as f:
+                self.clients[granularity] = FixtureClient(json.load(f)['candles'])
+
+    def request(self, endpoint):
+
+        return self.clients[endpoint.params['granularity']].request(endpoint)
+
+
+@pytest.mark.parametrize('case', list(CASES))
+def test_resampled_candles_match_api_candles(case):
+
+    MBA_candles, start_date, end_date = CASES[case]
+    client = GranularityClient(case)
+
+    reader = OandaHistoricCandles('USD', 'EUR', 'M5', MBA_candles, start_date, end_date, complete_only=False, client=client)
+    derived = reader.extract_resampled(['H1', 'H4', 'D'])
+
+    for time_interval in ('H1', 'H4', 'D'):
+        api = OandaHistoricCandles('USD', 'EUR', time_interval, MBA_candles, start_date, end_date, complete_only=False,
+                                   client=client).extract_candles()
+
+        columns = [column for column in COMPARED if column in api.columns]
+        assert len(api) > 0
+        pd.testing.assert_frame_equal(derived[time_interval][columns], api[columns], check_dtype=False)
+
+    if case == 'incomplete':
+        #the trailing M5 candle is still forming, so is every candle holding it
+        for time_interval in ('H1', 'H4', 'D'):
+            assert not derived[time_interval]['Complete'].iloc[-1]
+            assert derived[time_interval]['Complete'].iloc[:-1].all()
+    else:
+        #no candles are derived for the weekend closure
+        assert not (derived['D'].index.dayofweek == 5).any()
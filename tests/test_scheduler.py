@@ -0,0 +1,146 @@
+import threading
+import time
+import pandas as pd
+import pytest
+import requests
+import oandapyV20.endpoints.instruments as instruments
+from types import SimpleNamespace
+from oandapyV20.exceptions import V20Error
+from benchmarks.fixtures import synthetic_candles, FixtureClient
+from trade_read.oanda_client import RequestScheduler, retry_after_hook
+from trade_read.oanda_read import OandaHistoricCandles
+
+
+class FailingClient(FixtureClient):
+    '''
+    FixtureClient failing its first requests with the errors in failures, in order. An error is a status code, sent
+    with retry_after as the Retry-After header of a 429 or 503 as a pooled_client reports it, or an exception
+    '''
+
+    def __init__(self, candles = None, failures = (), retry_after = None):
+
+        super().__init__(candles)
+        self.failures = list(failures)
+        self.retry_after = retry_after
+        self.sent = []
+
+    def request(self, endpoint):
+
+        self.sent.append(time.monotonic())
+
+        if self.failures:
+            failure = self.failures.pop(0)
+            if isinstance(failure, Exception):
+                raise failure
+            headers = {'Retry-After': str(self.retry_after)} if self.retry_after is not None else {}
+            retry_after_hook(SimpleNamespace(status_code=failure, headers=headers))
+            raise V20Error(failure, '{"errorMessage": "stub"}')
+
+        return super().request(endpoint)
+
+
+@pytest.fixture(scope='module')
+def candles():
+    return synthetic_candles(2000, 'M5')
+
+def endpoint():
+    return instruments.InstrumentsCandles(instrument='EUR_USD', params={'count': 500, 'granularity': 'M5'})
+
+
+def test_retries_and_metrics(candles):
+
+    client = FailingClient(candles, [429, 503, requests.ConnectionError('reset')])
+    scheduler = RequestScheduler(client, requests_per_second=None, retry_backoff=0.001)
+
+    response = scheduler.request(endpoint())
+    metrics = scheduler.metrics()
+
+    assert len(response['candles']) == 500
+    assert metrics['requests'] == 4
+    assert metrics['successes'] == 1
+    assert metrics['throttled'] == 1
+    assert metrics['server_errors'] == 1
+    assert metrics['connection_errors'] == 1
+    assert metrics['retries'] == 3
+
+    scheduler.reset_metrics()
+    assert not any(scheduler.metrics().values())
+
+def test_client_errors_are_not_retried(candles):
+
+    client = FailingClient(candles, [400])
+    scheduler = RequestScheduler(client, requests_per_second=None, retry_backoff=0.001)
+
+    with pytest.raises(V20Error) as ex:
+        scheduler.request(endpoint())
+
+    assert ex.value.code == 400
+    assert scheduler.metrics()['requests'] == 1
+    assert scheduler.metrics()['retries'] == 0
+
+def test_gives_up_after_max_retries(candles):
+
+    client = FailingClient(candles, [500] * 10)
+    scheduler = RequestScheduler(client, requests_per_second=None, max_retries=3, retry_backoff=0.001)
+
+    with pytest.raises(V20Error):
+        scheduler.request(endpoint())
+
+    assert scheduler.metrics()['requests'] == 4
+    assert scheduler.metrics()['retries'] == 3
+
+def test_retry_after(candles):
+
+    client = FailingClient(candles, [429, 503], retry_after=0.2)
+    scheduler = RequestScheduler(client, requests_per_second=1000, retry_backoff=0.001)
+
+    scheduler.request(endpoint())
+
+    #each retry waits for Retry-After rather than the 1 ms backoff
+    assert client.sent[1] - client.sent[0] >= 0.19
+    assert client.sent[2] - client.sent[1] >= 0.19
+    assert scheduler.metrics()['backoff_wait'] >= 0.4
+
+def test_429_pauses_other_threads(candles):
+
+    client = FailingClient(candles, [429], retry_after=0.3)
+    scheduler = RequestScheduler(client, requests_per_second=1000, retry_backoff=0.001)
+
+    throttled = threading.Thread(target=scheduler.request, args=(endpoint(),))
+    throttled.start()
+    while not client.sent:
+        time.sleep(0.001)
+    time.sleep(0.05)
+
+    #a request of another thread waits on the paused bucket
+    started = time.monotonic()
+    scheduler.request(endpoint())
+    throttled.join()
+
+    assert time.monotonic() - started >= 0.2
+    assert scheduler.metrics()['throttle_wait'] >= 0.2
+
+def test_rate_limit(candles):
+
+    scheduler = RequestScheduler(FixtureClient(candles), requests_per_second=50, burst=1)
+
+    started = time.monotonic()
+    for _ in range(11):
+        scheduler.request(endpoint())
+
+    assert time.monotonic() - started >= 0.19
+    assert scheduler.metrics()['throttle_wait'] > 0
+
+def test_reader_through_scheduler(candles):
+
+    client = FailingClient(candles, [429, 502, 503])
+    scheduler = RequestScheduler(client, requests_per_second=None)
+
+    #the reader's retry settings apply to its requests
+    df = OandaHistoricCandles('USD', 'EUR', 'M5', False, '2023-01-02', '2023-01-10', client=scheduler,
+                              retry_backoff=0.001).extract_candles()
+    expected = OandaHistoricCandles('USD', 'EUR', 'M5', False, '2023-01-02', '2023-01-10',
+                                    client=FixtureClient(candles)).extract_candles()
+
+    pd.testing.assert_frame_equal(df, expected)
+    assert scheduler.metrics()['retries'] == 3
@@ -0,0 +1,73 @@
+import pandas as pd
+import pytest
+from benchmarks.fixtures import synthetic_candles, FixtureClient
+from trade_read.candle_store import OandaCandleStore
+from trade_read.oanda_read import OandaHistoricCandles
+
+
+class RecordingClient(FixtureClient):
+    '''
+    FixtureClient recording the from time of every request
+    '''
+
+    def __init__(self, candles = None):
+
+        super().__init__(candles)
+        self.starts = []
+
+    def request(self, endpoint):
+
+        self.starts.append(float(endpoint.params['from']))
+
+        return super().request(endpoint)
+
+
+@pytest.fixture(scope='module')
+def candles():
+    return synthetic_candles(30000, 'M5', True)
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_cached_re_read_makes_no_requests(tmp_path, candles, max_workers):
+
+    store = OandaCandleStore(str(tmp_path))
+    client = FixtureClient(candles)
+
+    first = OandaHistoricCandles('USD', 'EUR', 'M5', True, '2023-01-02', '2023-02-01', store=store, client=client,
+                                 max_workers=max_workers).extract_candles()
+    assert client.requests > 0
+
+    requests = client.requests
+    again = OandaHistoricCandles('USD', 'EUR', 'M5', True, '2023-01-02', '2023-02-01', store=store, client=client,
+                                 max_workers=max_workers).extract_candles()
+
+    assert client.requests == requests
+    pd.testing.assert_frame_equal(again, first)
+
+    #the same range from a new store instance on the same directory, as after a restart
+    again = OandaHistoricCandles('USD', 'EUR', 'M5', True, '2023-01-02', '2023-02-01', store=OandaCandleStore(str(tmp_path)),
+                                 client=client, max_workers=max_workers).extract_candles()
+
+    assert client.requests == requests
+    pd.testing.assert_frame_equal(again, first)
+
+def test_top_up_requests_only_the_missing_range(tmp_path, candles):
+
+    store = OandaCandleStore(str(tmp_path))
+    client = RecordingClient(candles)
+
+    stored = OandaHistoricCandles('USD', 'EUR', 'M5', True, '2023-01-16', '2023-02-01', store=store, client=client)
+    stored.extract_candles()
+
+    #the extended range only requests the two weeks before and the month after the stored range
+    del client.starts[:]
+    reader = OandaHistoricCandles('USD', 'EUR', 'M5', True, '2023-01-02', '2023-03-01', store=store, client=client)
+    df = reader.extract_candles()
+
+    assert client.starts
+    assert all(start < stored.start_date or start >= stored.end_date for start in client.starts)
+    assert store.missing(reader.currency_pair, 'M5', 'MBA', reader.start_date, reader.end_date) == []
+
+    expected = OandaHistoricCandles('USD', 'EUR', 'M5', True, '2023-01-02', '2023-03-01',
+                                    client=FixtureClient(candles)).extract_candles()
+    pd.testing.assert_frame_equal(df, expected)
@@ -0,0 +1,59 @@
+import os
+import pandas as pd
+import pytest
+from trade_read.oanda_stream import OandaStreamCandles, replay_messages, record_messages
+
+
+#EUR_USD pricing stream messages of 2023-01-03 10:00 to 10:02 UTC, with heartbeats and a GBP_USD price.
+#The 10:01 candle is completed by the heartbeat at 10:02:05, the 10:02 candle is still forming at the end
+MESSAGES = os.path.join(os.path.dirname(__file__), 'fixtures', 'stream', 'EUR_USD.jsonl')
+
+#expected (open, high, low, close) per block of the 10:00 and 10:01 M1 candles
+EXPECTED = {'mid': [(1.06015, 1.06035, 1.05995, 1.06020), (1.06055, 1.06055, 1.06046, 1.06050)],
+            'bid': [(1.06010, 1.06030, 1.05990, 1.06015), (1.06050, 1.06050, 1.06040, 1.06045)],
+            'ask': [(1.06020, 1.06040, 1.06000, 1.06025), (1.06060, 1.06060, 1.06052, 1.06055)]}
+
+SUFFIX = {'mid': '', 'bid': ' Bid', 'ask': ' Ask'}
+
+
+def test_consume_replay():
+
+    reader = OandaStreamCandles('USD', 'EUR', 'M1', True)
+    df = reader.consume(replay_messages(MESSAGES))
+
+    assert df.index.tolist() == [pd.Timestamp('2023-01-03 10:00'), pd.Timestamp('2023-01-03 10:01')]
+    for block, candles in EXPECTED.items():
+        columns = [name + SUFFIX[block] for name in ('Open', 'High', 'Low', 'Close')]
+        assert df[columns].values.tolist() == [pytest.approx(candle) for candle in candles]
+    assert df['Volume'].tolist() == [4, 3]
+    assert df['Complete'].all()
+
+def test_forming_candle():
+
+    reader = OandaStreamCandles('USD', 'EUR', 'M1', False, complete_only=False)
+    df = reader.consume(replay_messages(MESSAGES))
+
+    assert len(df) == 3
+    assert df['Complete'].tolist() == [True, True, False]
+    assert df.iloc[-1][['Open', 'Close', 'Volume']].tolist() == pytest.approx([1.06075, 1.06075, 1])
+
+def test_follow_yields_at_candle_close():
+
+    reader = OandaStreamCandles('USD', 'EUR', 'M1', False, complete_only=False)
+    frames = list(reader.follow(replay_messages(MESSAGES)))
+
+    #the first PRICE of 10:01 closes the 10:00 candle and opens the 10:01 candle
+    assert len(frames) == 2
+    assert frames[0]['Complete'].tolist() == [True, False]
+
+    #the 10:02:05 heartbeat closes the 10:01 candle before any 10:02 price arrives
+    assert frames[1].index[-1] == pd.Timestamp('2023-01-03 10:01')
+    assert frames[1]['Complete'].tolist() == [True, True]
+
+def test_record_and_replay(tmp_path):
+
+    path = str(tmp_path / 'messages.jsonl')
+    messages = list(replay_messages(MESSAGES))
+
+    assert list(record_messages(iter(messages), path)) == messages
+    assert list(replay_messages(path)) == messages
@@ -1,4 +1,48 @@
-from trade_read.oanda_read import *
-from trade_read.yahoo_finance_read import *
+#submodules and their public names are imported on first access, so e.g. a yfinance only worker never imports
+#oandapyV20 and importing the package does not need Oanda credentials
+import importlib
 
-__version__ = "0.0.0"
\ No newline at end of file
+__version__ = "0.0.0"
+
+_exports = {
+    'trade_read.oanda_read': ['OandaRecentCandles', 'OandaHistoricCandles', 'CANDLE_PRICE_COLUMNS', 'parse_candles',
+                              'parse_rfc3339', 'request_with_retry', 'oanda_granularity_list',
+                              'oanda_granularity_seconds', 'candle_open_time', 'resample_candles',
+                              'candle_qc', 'CANDLE_DTYPE_POLICIES', 'compact_candles', 'expand_candles',
+                              'candle_price_decimals'],
+    'trade_read.yahoo_finance_read': ['yfinance_ticker_reader', 'yfinance_universe_reader', 'ticker_info_cache',
+                                      'info_cache'],
+    'trade_read.candle_store': ['OandaCandleStore', 'merge_ranges'],
+    'trade_read.oanda_client': ['oanda_api_key', 'oanda_account_id', 'pooled_client', 'shared_client',
+                                'close_shared_clients', 'shared_scheduler', 'TokenBucket', 'RequestScheduler', 'backoff_delay', 'parse_retry_after'],
+    'trade_read.oanda_batch': ['OandaBatchCandles'],
+    'trade_read.oanda_backfill': ['OandaBackfill'],
+    'trade_read.oanda_stream': ['OandaStreamCandles', 'stream_time', 'replay_messages', 'record_messages'],
+    'trade_read.columnar': ['save_columnar', 'load_columnar'],
+    'trade_read.instrumentation': ['Instrumentation'],
+    'trade_read.async_read': ['AsyncRateLimiter', 'AsyncOandaClient', 'async_request_with_retry',
+                              'AsyncOandaRecentCandles', 'AsyncOandaHistoricCandles', 'async_yfinance_ticker_reader'],
+}
+
+_attributes = {name: module for module, names in _exports.items() for name in names}
+
+__all__ = list(_attributes)
+
+
+def __getattr__(name):
+
+    if name in _attributes:
+        value = getattr(importlib.import_module(_attributes[name]), name)
+        #cache on the package so later lookups skip __getattr__
+        globals()[name] = value
+        return value
+
+    if 'trade_read.' + name in _exports:
+        return importlib.import_module('trade_read.' + name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+
+    return sorted(list(globals()) + __all__)
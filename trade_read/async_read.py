@@ -0,0 +1,447 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio counterparts of the Oanda and yahoo finance readers
+"""
+
+
+###########################################
+#import libraries
+import asyncio
+import threading
+import json
+import time
+import requests
+from collections import deque
+import oandapyV20.endpoints.instruments as instruments
+from oandapyV20.exceptions import V20Error
+from oandapyV20.oandapyV20 import TRADING_ENVIRONMENTS
+from trade_read.oanda_read import OandaRecentCandles, OandaHistoricCandles
+from trade_read.oanda_client import oanda_api_key, backoff_delay, parse_retry_after, last_retry_after
+from trade_read.yahoo_finance_read import yfinance_ticker_reader, info_cache
+from trade_read.instrumentation import stage
+
+try:
+    import aiohttp
+except ImportError:
+    #optional, pip install trade-read[async]. Without aiohttp requests are sent from a worker thread
+    aiohttp = None
+
+
+class AsyncRateLimiter():
+    """
+    asyncio request rate limiter shared by any number of readers and sources on one event loop.
+    Used as an async context manager, every request holds one of max_concurrency semaphore slots and starts no
+    earlier than its reserved rate slot
+
+    Keyword Args:
+    requests_per_second - maximum request rate. Default 100
+    max_concurrency - maximum number of requests in flight. Default 10
+    """
+
+    def __init__(self, requests_per_second = 100, max_concurrency = 10):
+
+        self.interval = 1.0 / requests_per_second
+        self.next_slot = time.monotonic()
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def __aenter__(self):
+
+        await self.semaphore.acquire()
+
+        #slots are reserved without awaiting, so no lock is needed on a single event loop
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+
+        try:
+            if slot > now:
+                await asyncio.sleep(slot - now)
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+
+        self.semaphore.release()
+
+
+class AsyncOandaClient():
+    """
+    asyncio Oanda API client with the request(endpoint) interface of oandapyV20 API, as a coroutine
+
+    Keyword Args:
+    api_key - Oanda API key. If None the OANDA_API_KEY environment variable
+    environment - 'practice' or 'live'. Default 'practice'
+    base_url - REST API root, e.g. a local stub server 'http://127.0.0.1:8080'. If None the environment's URL
+    timeout - seconds allowed per request, asyncio.TimeoutError is raised when exceeded. Default 30.0
+    limiter - AsyncRateLimiter shared with other clients and readers. Default a new AsyncRateLimiter()
+    client - blocking oandapyV20 API compatible client, e.g. shared_client() or a local stub. If supplied every
+    request is sent with client.request from a worker thread
+
+    Requests use an aiohttp session when aiohttp is installed, otherwise a pooled requests session from a worker thread.
+    Cancelling a request aborts an aiohttp request, a worker thread request finishes in the background and its
+    response is discarded.
+    Responses with status >= 400 raise V20Error(status, body) as oandapyV20 does. The Retry-After header of a 429 or
+    503 response is kept in the error's retry_after attribute, in seconds, None if there was none.
+    """
+
+    def __init__(self, api_key = None, environment = 'practice', base_url = None, timeout = 30.0, limiter = None, client = None):
+
+        self.environment = environment
+        self.base_url = base_url if base_url is not None else TRADING_ENVIRONMENTS[environment]['api']
+        self.timeout = timeout
+        self.limiter = limiter if limiter is not None else AsyncRateLimiter()
+        self.client = client
+
+        self.headers = {}
+        if client is None:
+            if api_key is None:
+                api_key = oanda_api_key()
+            self.headers = {'Authorization': 'Bearer ' + api_key,
+                            'Content-Type': 'application/json',
+                            'Accept-Encoding': 'gzip, deflate'}
+
+        #sessions are created on first use, inside the running event loop
+        self.session = None
+
+    async def request(self, endpoint):
+        '''
+        (oandapyV20 APIRequest)->(dictionary)
+        Send the request and return the decoded JSON response, also stored in endpoint.response
+        '''
+        async with self.limiter:
+            if self.client is not None:
+                return await asyncio.wait_for(asyncio.to_thread(request_in_thread, self.client, endpoint), self.timeout)
+
+            return await asyncio.wait_for(self.send(endpoint), self.timeout)
+
+    async def send(self, endpoint):
+        '''
+        (oandapyV20 APIRequest)->(dictionary)
+        Send a GET request for the endpoint over HTTP
+        '''
+        url = f"{self.base_url}/{endpoint}"
+        params = {key: str(value) for key, value in getattr(endpoint, 'params', {}).items()}
+
+        if aiohttp is not None:
+            if self.session is None:
+                self.session = aiohttp.ClientSession(headers=self.headers)
+            async with self.session.request(endpoint.method, url, params=params) as response:
+                status = response.status
+                headers = response.headers
+                body = await response.text()
+        else:
+            if self.session is None:
+                #one keep-alive connection per request the limiter lets into flight
+                adapter = requests.adapters.HTTPAdapter(pool_connections=self.limiter.max_concurrency,
+                                                        pool_maxsize=self.limiter.max_concurrency)
+                self.session = requests.Session()
+                self.session.headers.update(self.headers)
+                self.session.mount('https://', adapter)
+                self.session.mount('http://', adapter)
+            try:
+                response = await asyncio.to_thread(self.session.request, endpoint.method, url, params=params, timeout=self.timeout)
+            except requests.exceptions.Timeout as ex:
+                #same exception as an asyncio.wait_for timeout
+                raise asyncio.TimeoutError(str(ex)) from ex
+            status = response.status_code
+            headers = response.headers
+            body = response.text
+
+        if status >= 400:
+            error = V20Error(status, body)
+            error.retry_after = parse_retry_after(headers.get('Retry-After')) if status in (429, 503) else None
+            raise error
+
+        content = json.loads(body)
+
+        endpoint.response = content
+        endpoint.status_code = status
+
+        return content
+
+    async def close(self):
+        '''
+        ()->(None)
+        Close the HTTP session
+        '''
+        if self.session is None:
+            return None
+
+        if aiohttp is not None:
+            await self.session.close()
+        else:
+            self.session.close()
+        self.session = None
+
+
+def request_in_thread(client, endpoint):
+    '''
+    (oandapyV20 API compatible client, oandapyV20 APIRequest)->(dictionary)
+    Send a request with a blocking client, run in a worker thread. The Retry-After recorded for the thread by
+    retry_after_hook is attached to a V20Error as retry_after
+    '''
+    last_retry_after()
+
+    try:
+        return client.request(endpoint)
+    except V20Error as ex:
+        ex.retry_after = last_retry_after()
+        raise
+
+async def async_request_with_retry(client, endpoint, max_retries = 5, retry_backoff = 1.0):
+    '''
+    (AsyncOandaClient, oandapyV20 APIRequest, int, float)->(dictionary)
+    Coroutine counterpart of request_with_retry. Retries on 429 (rate limit), 5xx, connection errors and request
+    timeouts with a jittered exponential backoff, see backoff_delay. The Retry-After of a 429 or 503 response is a
+    lower bound of the delay, as in RequestScheduler.request. 4xx client errors are raised immediately.
+    Cancellation is never retried.
+    '''
+    retryable = (requests.exceptions.RequestException, asyncio.TimeoutError, ConnectionError)
+    if aiohttp is not None:
+        retryable += (aiohttp.ClientError,)
+
+    for attempt in range(max_retries + 1):
+        retry_after = None
+        try:
+            return await client.request(endpoint)
+        except V20Error as ex:
+            if attempt == max_retries or not (ex.code == 429 or ex.code >= 500):
+                raise
+            retry_after = getattr(ex, 'retry_after', None)
+        except retryable:
+            if attempt == max_retries:
+                raise
+
+        await asyncio.sleep(backoff_delay(attempt, retry_backoff, retry_after=retry_after))
+
+
+class AsyncOandaRecentCandles(OandaRecentCandles):
+    """
+    asyncio counterpart of OandaRecentCandles, get_candles and poll are coroutines with the same return schema
+
+    Keyword Args:
+    As OandaRecentCandles. Client - AsyncOandaClient, if None a new AsyncOandaClient() is used
+    """
+
+    def __init__(self, *args, client = None, **kwargs):
+
+        if client is None:
+            client = AsyncOandaClient()
+
+        super().__init__(*args, client=client, **kwargs)
+
+    async def get_candles(self):
+
+        r=instruments.InstrumentsCandles(instrument=self.currency_pair,params=self.params)
+
+        with stage(self.instrumentation, 'request'):
+            data = await self.client.request(r)
+
+        return self.candles_frame(data)
+
+    async def poll(self):
+        '''
+        ()->(pandas dataframe)
+        Coroutine counterpart of OandaRecentCandles.poll
+        '''
+        params = self.poll_params()
+
+        r=instruments.InstrumentsCandles(instrument=self.currency_pair,params=params)
+
+        with stage(self.instrumentation, 'request'):
+            data = await async_request_with_retry(self.client, r)
+
+        return self.update_tail(params, data)
+
+
+class AsyncOandaHistoricCandles(OandaHistoricCandles):
+    """
+    asyncio counterpart of OandaHistoricCandles, extract_candles and extract_resampled are coroutines with the same
+    return schema and aiter_candles is the async generator counterpart of iter_candles
+
+    Keyword Args:
+    As OandaHistoricCandles. Client - AsyncOandaClient, if None a new AsyncOandaClient() is used
+
+    With max_workers > 1 up to max_workers * 2 request windows are fetched as concurrent tasks, bounded by the client's
+    rate limiter, otherwise the whole range is paged in one task. Pages of other instruments and sources interleave on
+    the loop. Store reads and writes run in worker threads, off the event loop.
+    Cancelling extract_candles or closing aiter_candles cancels every window task in flight.
+    """
+
+    def __init__(self, *args, client = None, **kwargs):
+
+        if client is None:
+            client = AsyncOandaClient()
+
+        super().__init__(*args, client=client, **kwargs)
+
+    async def extract_candles(self):
+
+        chunks = [df async for df in self.aiter_candles()]
+
+        return self.concat_dataset(chunks)
+
+    async def extract_resampled(self, time_intervals):
+        '''
+        (list of strings)->(dictionary of pandas dataframes)
+        Coroutine counterpart of OandaHistoricCandles.extract_resampled
+        '''
+        return self.derive_resampled(await self.extract_candles(), time_intervals)
+
+    def iter_candles(self):
+        '''
+        ()->(async generator of pandas dataframes)
+        Same as aiter_candles, iterate with async for
+        '''
+        return self.aiter_candles()
+
+    async def aiter_candles(self):
+        '''
+        ()->(async generator of pandas dataframes)
+        Async counterpart of OandaHistoricCandles.iter_candles - yield the dataset one page (sequential) or window
+        (max_workers > 1) at a time, in time order, qc'd and in the dtype policy
+        '''
+        self.windows = self.plan_windows()
+        self.start_qc()
+
+        async for df in self.aiter_pages():
+            df = self.qc_chunk(df)
+            if not df.empty:
+                yield df
+
+    async def aiter_pages(self):
+        '''
+        ()->(async generator of pandas dataframes)
+        Yield the raw pages of self.windows and the stored segments of the covered ranges in time order, see
+        OandaHistoricCandles.merge_store
+        '''
+        windows = iter(self.windows)
+        pending = deque()
+
+        def submit():
+            window = next(windows, None)
+            if window is not None:
+                pending.append(asyncio.create_task(self.fetch_window(window)))
+
+        try:
+            if self.max_workers > 1:
+                for _ in range(2 * self.max_workers):
+                    submit()
+
+            for start, end, fetched in self.dataset_pieces():
+                if not fetched:
+                    for df in await asyncio.to_thread(list, self.store.iter_read(self.currency_pair, self.time_interval,
+                                                                                 self.price_candles, start, end)):
+                        yield df
+                elif self.max_workers > 1:
+                    task = pending.popleft()
+                    submit()
+                    yield await task
+                else:
+                    async for df in self.aiter_window((start, end)):
+                        yield df
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def fetch_window(self, window):
+        '''
+        (tuple)->(pandas dataframe)
+        Coroutine counterpart of OandaHistoricCandles.fetch_window
+        '''
+        return self.combine_pages([df async for df in self.aiter_window(window)])
+
+    async def aiter_window(self, window):
+        '''
+        (tuple)->(async generator of pandas dataframes)
+        Async counterpart of OandaHistoricCandles.iter_window
+        '''
+        i, end = window
+
+        while i < end:
+
+            r = self.window_request(i)
+
+            with stage(self.instrumentation, 'request'):
+                data = await async_request_with_retry(self.client, r, self.max_retries, self.retry_backoff)
+
+            #with a store window_page writes the page to disk, keep that blocking I/O off the event loop
+            if self.store is not None:
+                df, i = await asyncio.to_thread(self.window_page, i, end, data)
+            else:
+                df, i = self.window_page(i, end, data)
+
+            yield df
+
+
+#yf.download keeps its results in module globals, so downloads from worker threads run one at a time
+yfinance_download_lock = threading.Lock()
+
+
+class async_yfinance_ticker_reader(yfinance_ticker_reader):
+
+    '''
+    asyncio counterpart of yfinance_ticker_reader. read_ticker_pandas_start_end, read_ticker_pandas_period and
+    ticker_info are coroutines returning the same code dictionaries.
+
+    yfinance is a blocking library, so each call runs in a worker thread. yf.download calls are serialised as
+    yfinance keeps download results in module globals, ticker_info calls run concurrently.
+
+    Keyword Args:
+    ticker - as yfinance_ticker_reader
+    info_cache - as yfinance_ticker_reader
+    instrumentation - as yfinance_ticker_reader
+    limiter - AsyncRateLimiter, may be shared with AsyncOandaClient. Default a new AsyncRateLimiter()
+    timeout - seconds allowed per call. Default 60.0
+    A call exceeding the timeout returns code 408 and None data, the worker thread finishes in the background.
+    '''
+
+    def __init__(self, ticker = None, info_cache = info_cache, limiter = None, timeout = 60.0, instrumentation = None):
+
+        super().__init__(ticker, info_cache, instrumentation)
+
+        self.limiter = limiter if limiter is not None else AsyncRateLimiter()
+        self.timeout = timeout
+
+    async def run(self, method, key, *args, **kwargs):
+        '''
+        (function, str, *args, **kwargs)->(dictionary)
+        Run a blocking reader method in a worker thread under the limiter and timeout
+        '''
+        async with self.limiter:
+            try:
+                return await asyncio.wait_for(asyncio.to_thread(method, *args, **kwargs), self.timeout)
+            except asyncio.TimeoutError:
+                print(f"yahoo finance request for {self.ticker} timed out")
+                return {'code': 408, key: None}
+
+    def locked(self, method):
+        '''
+        (function)->(function)
+        Wrap a method calling yf.download so it holds yfinance_download_lock
+        '''
+        def call(*args, **kwargs):
+            with yfinance_download_lock:
+                return method(*args, **kwargs)
+
+        return call
+
+    async def read_ticker_pandas_start_end(self, start = None, end = None, interval = None, period = None, progress = False):
+
+        method = self.locked(super().read_ticker_pandas_start_end)
+
+        return await self.run(method, 'ticker ohlc', start, end, interval, period, progress)
+
+    async def read_ticker_pandas_period(self, period = None, interval = None, progress = False):
+
+        method = self.locked(super().read_ticker_pandas_period)
+
+        return await self.run(method, 'ticker ohlc', period, interval, progress)
+
+    async def ticker_info(self):
+
+        return await self.run(super().ticker_info, 'ticker stats')
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Local on-disk store of downloaded Oanda candles
+"""
+
+
+###########################################
+#import libraries
+import pandas as pd
+import numpy as np
+import os
+import json
+import glob
+import threading
+
+
+class OandaCandleStore():
+    """
+    Persistent local candle cache used by OandaHistoricCandles to avoid re-downloading history
+
+    Keyword Args:
+    root - Required, directory the store is written to. Created if it does not exist
+
+    Layout
+    Each (instrument, granularity, price component) key is a sub directory e.g. root/EUR_USD_M1_MBA containing
+    coverage.json -> list of [from, to] unix timestamp ranges already downloaded, merged and sorted
+    <from>_<to>.npz -> one append only segment per downloaded request window, one numpy array per column.
+    Time is stored as int64 nanoseconds
+
+    Segments and coverage are written to a temporary file and moved into place, an interrupted write never leaves a
+    partial file behind. Only complete candles are stored, the forming candle is always requested again.
+
+    Functions
+    missing -> return the (from, to) ranges of a request not yet covered by the store
+
+    write -> add a downloaded window to the store and mark its range as covered
+
+    read -> load the stored candles of a time range as a dataframe
+
+    iter_read -> yield the stored candles of a time range one segment at a time
+
+    compact -> merge all segments of a key into a single segment
+    """
+
+    def __init__(self, root = None):
+
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+        #coverage.json updates are read-modify-write, serialise writers from concurrent fetch threads
+        self.lock = threading.Lock()
+
+    def key_path(self, instrument, granularity, price):
+        '''
+        (str, str, str)->(str)
+        Return the directory holding the segments of an (instrument, granularity, price component) key
+        '''
+        return os.path.join(self.root, f"{instrument}_{granularity}_{price}")
+
+    def coverage(self, instrument, granularity, price):
+        '''
+        (str, str, str)->(list of lists)
+        Return the sorted, merged [from, to] unix timestamp ranges already held for a key
+        '''
+        path = os.path.join(self.key_path(instrument, granularity, price), 'coverage.json')
+
+        if not os.path.exists(path):
+            return []
+
+        with open(path) as f:
+            return json.load(f)
+
+    def missing(self, instrument, granularity, price, start, end):
+        '''
+        (str, str, str, int, int)->(list of tuples)
+        Return the (from, to) ranges of [start, end) that are not covered by the store, in time order
+        '''
+        gaps = []
+        i = start
+
+        for cov_start, cov_end in self.coverage(instrument, granularity, price):
+            if cov_end <= i:
+                continue
+            if cov_start >= end:
+                break
+            if cov_start > i:
+                gaps.append((i, cov_start))
+            i = max(i, cov_end)
+
+        if i < end:
+            gaps.append((i, end))
+
+        return gaps
+
+    def write(self, instrument, granularity, price, df, start, end):
+        '''
+        (str, str, str, pandas dataframe, int, int)->(None)
+        Store the candles of a downloaded window and mark [start, end) as covered.
+        df is a parse_candles dataframe with a Time column, incomplete candles must already be removed.
+        '''
+        path = self.key_path(instrument, granularity, price)
+        os.makedirs(path, exist_ok=True)
+
+        if not df.empty:
+            columns = {name: df[name].values for name in df.columns}
+            columns['Time'] = df['Time'].values.astype('datetime64[ns]').astype(np.int64)
+
+            segment = os.path.join(path, f"{int(start)}_{int(end)}.npz")
+            tmp = segment + '.tmp'
+            with open(tmp, 'wb') as f:
+                np.savez(f, **columns)
+            os.replace(tmp, segment)
+
+        with self.lock:
+            ranges = self.coverage(instrument, granularity, price) + [[int(start), int(end)]]
+            self.write_coverage(path, merge_ranges(ranges))
+
+    def write_coverage(self, path, ranges):
+        '''
+        (str, list of lists)->(None)
+        Atomically replace coverage.json of a key directory
+        '''
+        tmp = os.path.join(path, 'coverage.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(ranges, f)
+        os.replace(tmp, os.path.join(path, 'coverage.json'))
+
+    def segments(self, instrument, granularity, price):
+        '''
+        (str, str, str)->(list of tuples)
+        Return (from, to, file path) for every segment of a key, sorted by from
+        '''
+        segments = []
+
+        for file in glob.glob(os.path.join(self.key_path(instrument, granularity, price), '*.npz')):
+            seg_start, seg_end = os.path.basename(file)[:-4].split('_')
+            segments.append((int(seg_start), int(seg_end), file))
+
+        return sorted(segments)
+
+    def read(self, instrument, granularity, price, start, end):
+        '''
+        (str, str, str, int, int)->(pandas dataframe)
+        Return the stored candles with start <= Time < end, sorted by Time with duplicate timestamps removed.
+        Returns an empty dataframe if nothing is stored for the range.
+        '''
+        frames = []
+
+        for seg_start, seg_end, file in self.segments(instrument, granularity, price):
+            if seg_end < start or seg_start >= end:
+                continue
+            with np.load(file) as npz:
+                frames.append(pd.DataFrame({name: npz[name] for name in npz.files}))
+
+        if not frames:
+            return pd.DataFrame()
+
+        df = pd.concat(frames, ignore_index=True)
+
+        start_ns = np.int64(start) * 10**9
+        end_ns = np.int64(end) * 10**9
+        df = df[(df['Time'].values >= start_ns) & (df['Time'].values < end_ns)]
+
+        #overlapping segments share boundary candles - keep the most recently written copy
+        df = df.sort_values('Time', kind='stable').drop_duplicates('Time', keep='last')
+        df['Time'] = df['Time'].values.astype('datetime64[ns]')
+
+        return df.reset_index(drop=True)
+
+    def iter_read(self, instrument, granularity, price, start, end):
+        '''
+        (str, str, str, int, int)->(generator of pandas dataframes)
+        Yield the stored candles with start <= Time < end one segment at a time, in time order.
+        Candles already yielded from an earlier segment are dropped, so segment boundaries are never duplicated.
+        '''
+        start_ns = np.int64(start) * 10**9
+        end_ns = np.int64(end) * 10**9
+        last_ns = None
+
+        for seg_start, seg_end, file in self.segments(instrument, granularity, price):
+            if seg_end < start or seg_start >= end:
+                continue
+            with np.load(file) as npz:
+                df = pd.DataFrame({name: npz[name] for name in npz.files})
+
+            keep = (df['Time'].values >= start_ns) & (df['Time'].values < end_ns)
+            if last_ns is not None:
+                keep &= df['Time'].values > last_ns
+            df = df[keep]
+
+            if df.empty:
+                continue
+
+            last_ns = df['Time'].values[-1]
+            df['Time'] = df['Time'].values.astype('datetime64[ns]')
+
+            yield df.reset_index(drop=True)
+
+    def compact(self, instrument, granularity, price):
+        '''
+        (str, str, str)->(None)
+        Merge all segments of a key into one segment spanning the stored range. Reduces file count after many top-ups.
+        '''
+        segments = self.segments(instrument, granularity, price)
+
+        if len(segments) < 2:
+            return None
+
+        start = segments[0][0]
+        end = max(seg_end for seg_start, seg_end, file in segments)
+        df = self.read(instrument, granularity, price, start, end + 1)
+
+        columns = {name: df[name].values for name in df.columns}
+        columns['Time'] = df['Time'].values.astype(np.int64)
+
+        merged = os.path.join(self.key_path(instrument, granularity, price), f"{start}_{end}.npz")
+        tmp = merged + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, **columns)
+        os.replace(tmp, merged)
+
+        for seg_start, seg_end, file in segments:
+            if file != merged:
+                os.remove(file)
+
+
+def merge_ranges(ranges):
+    '''
+    (list of lists)->(list of lists)
+    Sort [from, to] ranges and merge any that overlap or touch
+    '''
+    merged = []
+
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    return merged
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-mapped columnar files for downloaded candle datasets
+"""
+
+
+###########################################
+#import libraries
+import pandas as pd
+import numpy as np
+import os
+import json
+import shutil
+
+
+#layout version written to schema.json
+COLUMNAR_VERSION = 1
+
+
+def save_columnar(df, path):
+    '''
+    (pandas dataframe, str)->(None)
+    Write a dataframe as a directory of one raw .npy file per column plus schema.json, for load_columnar.
+    Works for the output of OandaRecentCandles, OandaHistoricCandles and the yfinance readers, including MultiIndex
+    columns, tz aware DatetimeIndex and any dtype policy.
+
+    Layout
+    schema.json -> version, row count, column labels and dtypes, index name, dtype and timezone
+    index.npy -> index values, Datetime indexes as int64 nanoseconds UTC. Not written for a RangeIndex
+    c<n>.npy -> values of the n-th column
+
+    Only numeric, bool, datetime64 and timedelta64 columns and a single level index are supported, object columns can
+    not be memory mapped. The directory is written to a temporary directory and moved into place, a reader never sees
+    a partial dataset. Processes that still have the previous version mapped keep reading it until they reload.
+    '''
+    columns = []
+    arrays = {}
+
+    for n, label in enumerate(df.columns):
+        values = df.iloc[:, n].values
+        if not isinstance(values, np.ndarray) or values.dtype.kind not in 'biufmM':
+            raise TypeError(f"column {label!r} of dtype {df.iloc[:, n].dtype} can not be memory mapped")
+        file = f"c{n}.npy"
+        arrays[file] = values
+        columns.append({'label': list(label) if isinstance(label, tuple) else label, 'file': file, 'dtype': values.dtype.str})
+
+    index = df.index
+    if isinstance(index, pd.MultiIndex):
+        raise ValueError("a MultiIndex index can not be memory mapped, save each (instrument, granularity) frame separately")
+
+    if isinstance(index, pd.RangeIndex):
+        index_schema = {'kind': 'range', 'start': index.start, 'step': index.step}
+    elif isinstance(index, pd.DatetimeIndex):
+        index_schema = {'kind': 'datetime', 'file': 'index.npy', 'tz': None if index.tz is None else str(index.tz)}
+        arrays['index.npy'] = index.asi8
+    elif index.dtype.kind in 'biufmM':
+        index_schema = {'kind': 'values', 'file': 'index.npy'}
+        arrays['index.npy'] = index.values
+    else:
+        raise TypeError(f"index of dtype {index.dtype} can not be memory mapped")
+    index_schema['name'] = index.name
+
+    schema = {'version': COLUMNAR_VERSION,
+              'rows': len(df),
+              'columns': columns,
+              'column_names': list(df.columns.names),
+              'multi_columns': isinstance(df.columns, pd.MultiIndex),
+              'index': index_schema}
+
+    path = os.path.normpath(path)
+    tmp = path + '.tmp'
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+
+    for file, values in arrays.items():
+        np.save(os.path.join(tmp, file), np.ascontiguousarray(values), allow_pickle=False)
+
+    with open(os.path.join(tmp, 'schema.json'), 'w') as f:
+        json.dump(schema, f, default=str)
+
+    #swap the new directory into place, the old one is removed only after the rename
+    old = None
+    if os.path.exists(path):
+        old = path + '.old'
+        if os.path.exists(old):
+            shutil.rmtree(old)
+        os.replace(path, old)
+    os.replace(tmp, path)
+    if old is not None:
+        shutil.rmtree(old)
+
+def load_columnar(path, mmap = True):
+    '''
+    (str, bool)->(pandas dataframe)
+    Open a save_columnar directory. With mmap=True every column is a read only numpy memmap wrapped without a copy,
+    so any number of processes loading the same dataset share one page cache copy and only the pages actually touched
+    are read from disk. Writing to the frame raises ValueError, use df.copy() for a private writable copy.
+    With mmap=False the columns are read into memory.
+    '''
+    with open(os.path.join(path, 'schema.json')) as f:
+        schema = json.load(f)
+
+    if schema['version'] != COLUMNAR_VERSION:
+        raise ValueError(f"unsupported columnar version {schema['version']}")
+
+    mmap_mode = 'r' if mmap else None
+
+    def read(file):
+        return np.load(os.path.join(path, file), mmap_mode=mmap_mode, allow_pickle=False)
+
+    index_schema = schema['index']
+    if index_schema['kind'] == 'range':
+        start, step = index_schema['start'], index_schema['step']
+        index = pd.RangeIndex(start, start + step * schema['rows'], step, name=index_schema['name'])
+    elif index_schema['kind'] == 'datetime':
+        values = read(index_schema['file']).view('datetime64[ns]')
+        if index_schema['tz'] is None:
+            index = pd.DatetimeIndex(values, name=index_schema['name'], copy=False)
+        else:
+            values = pd.arrays.DatetimeArray(values, dtype=pd.DatetimeTZDtype(tz=index_schema['tz']), copy=False)
+            index = pd.DatetimeIndex(values, name=index_schema['name'], copy=False)
+    else:
+        index = pd.Index(read(index_schema['file']), name=index_schema['name'], copy=False)
+
+    labels = [tuple(column['label']) if schema['multi_columns'] else column['label'] for column in schema['columns']]
+
+    #copy=False keeps one block per column, so no column is copied into a consolidated 2D block
+    df = pd.DataFrame({n: read(column['file']) for n, column in enumerate(schema['columns'])}, index=index, copy=False)
+
+    if schema['multi_columns']:
+        df.columns = pd.MultiIndex.from_tuples(labels, names=schema['column_names'])
+    else:
+        df.columns = pd.Index(labels, name=schema['column_names'][0])
+
+    return df
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Stage timers, throughput counters and event hooks for the download pipeline
+"""
+
+
+###########################################
+#import libraries
+import threading
+import contextlib
+import time
+
+
+class Instrumentation():
+    """
+    Collect per stage timings, counters and events of the readers it is passed to. Thread safe, one instance can be
+    shared by every reader and worker thread of a process.
+
+    Keyword Args:
+    callback - function(event name, dictionary of fields) called for every event, e.g. each page of candles read.
+    Default None
+
+    Stages timed by the readers
+    request -> Oanda client.request, HTTP wait plus body download and JSON decode (done together by oandapyV20)
+    http -> time to response headers of each Oanda request (pooled clients only)
+    parse prices, parse time, frame -> parse_candles price conversion, RFC3339 timestamp parsing and DataFrame build
+    qc, store, concat -> Complete filter and dtype policy per chunk, store writes, final concat
+    download, info -> yf.download and yf.Ticker.info calls
+
+    Every stage also counts its calls, e.g. the number of requests.
+    Counters: rows (candles parsed, yahoo rows downloaded), bytes (Oanda response bodies, pooled clients only, streamed
+    responses by Content-Length)
+
+    With instrumentation=None, the default, readers skip all of this - each stage costs a shared no-op context manager
+
+    Functions
+    stage -> context manager timing a block under a stage name
+
+    add -> add to a counter
+
+    event -> pass an event to the callback
+
+    report -> snapshot of timers, counters, rows/sec and bytes/sec
+
+    reset -> clear all timers and counters
+    """
+
+    def __init__(self, callback = None):
+
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.reset()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''
+        (str)->(context manager)
+        Time the enclosed block and add it to the stage. The instance is the active instrumentation of the thread for
+        the duration of the block, see active_instrumentation
+        '''
+        previous = getattr(active_local, 'instrumentation', None)
+        active_local.instrumentation = self
+        start = time.perf_counter()
+
+        try:
+            yield self
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+            active_local.instrumentation = previous
+
+    def add_time(self, name, seconds):
+        '''
+        (str, float)->(None)
+        Add a timing to a stage
+        '''
+        with self.lock:
+            total, calls = self.timers.get(name, (0.0, 0))
+            self.timers[name] = (total + seconds, calls + 1)
+
+    def add(self, name, value = 1):
+        '''
+        (str, float)->(None)
+        Add value to a counter
+        '''
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def event(self, name, **fields):
+        '''
+        (str, **fields)->(None)
+        Pass an event to the callback
+        '''
+        if self.callback is not None:
+            self.callback(name, fields)
+
+    def report(self):
+        '''
+        ()->(dictionary)
+        Return the stage timings {stage: {'seconds', 'calls'}}, the counters and rows/sec and bytes/sec over the wall
+        time since the instance was created or reset
+        '''
+        with self.lock:
+            elapsed = time.perf_counter() - self.started
+            return {'elapsed': elapsed,
+                    'timers': {name: {'seconds': total, 'calls': calls} for name, (total, calls) in self.timers.items()},
+                    'counters': dict(self.counters),
+                    'rows_per_second': self.counters.get('rows', 0) / elapsed if elapsed > 0 else 0.0,
+                    'bytes_per_second': self.counters.get('bytes', 0) / elapsed if elapsed > 0 else 0.0}
+
+    def reset(self):
+        '''
+        ()->(None)
+        Clear all timers and counters and restart the wall clock
+        '''
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+            self.started = time.perf_counter()
+
+
+#instrumentation of the stage currently running in each thread, read by the session response hook
+active_local = threading.local()
+
+#shared no-op context manager used when instrumentation is disabled
+null_stage = contextlib.nullcontext()
+
+def stage(instrumentation, name):
+    '''
+    (Instrumentation, str)->(context manager)
+    Return instrumentation.stage(name), or a no-op context manager when instrumentation is None
+    '''
+    if instrumentation is None:
+        return null_stage
+
+    return instrumentation.stage(name)
+
+def active_instrumentation():
+    '''
+    ()->(Instrumentation)
+    Return the instrumentation of the stage running in the calling thread, None outside any stage
+    '''
+    return getattr(active_local, 'instrumentation', None)
+
+def instrumentation_hook(response, *args, **kwargs):
+    '''
+    (requests Response)->(None)
+    requests session response hook, adds the response time to headers and the body size to the active instrumentation.
+    The body of a streamed response, e.g. the pricing stream, belongs to the caller and is never read here, only its
+    Content-Length is counted if it has one
+    '''
+    instrumentation = getattr(active_local, 'instrumentation', None)
+
+    if instrumentation is not None:
+        instrumentation.add_time('http', response.elapsed.total_seconds())
+        if not kwargs.get('stream'):
+            instrumentation.add('bytes', len(response.content))
+        elif response.headers.get('Content-Length', '').isdigit():
+            instrumentation.add('bytes', int(response.headers['Content-Length']))
@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-process backfill of Oanda candle history into columnar slices, resumable through a manifest
+"""
+
+
+###########################################
+#import libraries
+import pandas as pd
+import argparse
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from trade_read.oanda_read import OandaHistoricCandles, CANDLE_DTYPE_POLICIES
+from trade_read.oanda_client import oanda_api_key, shared_client, RequestScheduler
+from trade_read.columnar import save_columnar, load_columnar
+
+
+logger = logging.getLogger(__name__)
+
+#layout version written to manifest.json
+MANIFEST_VERSION = 1
+
+#settings a manifest is tied to, a resumed backfill must use the same values
+MANIFEST_SETTINGS = ('MBA_candles', 'slice_days', 'complete_only', 'dtype_policy', 'price_decimals')
+
+
+class OandaBackfill():
+    """
+    Class to backfill candle history for many instruments and granularities on a process pool
+
+    The date range of every (instrument, granularity) is split into time slices. Each slice is one task, downloaded by
+    an OandaHistoricCandles in a worker process and written to root as a save_columnar directory, see load_slices.
+    manifest.json in root records the state of every task, a crashed or interrupted backfill resumes with the same
+    call and only downloads the slices not yet done.
+
+    Keyword Args:
+    currency pairs: list of (base currency, quote currency) tuples e.g. [('USD','EUR'), ('USD','GBP')] - Required
+    Time Intervals: list of granularities e.g. ['S5','H4'] - Required
+    Price Candles options 'M' or 'MBA' - 'mid', 'bid','ask'
+    Start Date - Required, format "YYYY-MM-DD"
+    End Date - format "YYYY-MM-DD". if None then read up to today
+    Root - Required, output directory. Created if it does not exist
+    Slice Days - days per slice. Slices are aligned to multiples of slice_days since 1970-01-01, so a later backfill
+    over a longer date range reuses the slices already done. The first and last slice may extend past the dates.
+    Default 30
+    Processes - number of worker processes. Default os.cpu_count()
+    Requests Per Second - rate limit shared by all processes, each process gets an equal share. Default 100
+    Client Factory - picklable function returning an oandapyV20 API compatible client, called once in each worker
+    process, e.g. for a local stub. If None each worker uses its own shared_client()
+    Dtype Policy - 'float64', 'float32' or 'pips', see compact_candles. Default 'float64'
+    Price Decimals - dictionary of the 'pips' price decimals per instrument e.g. {'EUR_USD': 5, 'USD_JPY': 3}, required
+    for every instrument with dtype_policy 'pips' so that all slices of an instrument share one scale. Default None
+
+    Layout
+    manifest.json -> version, settings and one entry per task: status, rows, seconds, attempts, error
+    <instrument>_<granularity>_<price>/<from>_<to> -> save_columnar directory of one slice, dates as YYYYMMDD
+
+    Task status
+    pending -> not yet downloaded
+    done -> slice written, never downloaded again
+    open -> slice written but reaching into the present, downloaded again on the next run
+    failed -> the download raised after the reader's retries, retried on the next run
+
+    Slices are written to a temporary directory and moved into place, and the manifest is written by the parent
+    process only, to a temporary file moved into place after every finished task. A slice is never marked done before
+    it is complete on disk, so killing the backfill at any point loses at most the slices in flight.
+
+    ***NOTE*** TIME SETTINGS ARE UTC, REF ZERO HOURS
+
+    Functions
+    plan_tasks -> list of (instrument, granularity, time slice) tasks of the backfill
+
+    run -> download every task not yet done and return the manifest summary
+
+    summary -> number of tasks per status
+
+    load_slices -> read the done slices of an (instrument, granularity) back as one dataframe
+    """
+
+    def __init__(self,
+        currency_pairs = None,
+        time_intervals = None,
+        MBA_candles = False,
+        start_date = None,
+        end_date = None,
+        root = None,
+        slice_days = 30,
+        processes = None,
+        requests_per_second = 100,
+        complete_only = True,
+        client_factory = None,
+        dtype_policy = 'float64',
+        price_decimals = None
+        ):
+
+        #set variables to  class self
+        self.currency_pairs = currency_pairs
+        self.time_intervals = time_intervals
+        self.MBA_candles = MBA_candles
+        self.start_date = start_date
+        self.end_date = end_date
+        self.root = root
+        self.slice_days = slice_days
+        self.processes = processes if processes is not None else os.cpu_count()
+        self.requests_per_second = requests_per_second
+        self.complete_only = complete_only
+        self.client_factory = client_factory
+        self.dtype_policy = dtype_policy
+        self.price_decimals = price_decimals
+
+        if self.dtype_policy not in CANDLE_DTYPE_POLICIES:
+            raise ValueError(f"Unknown dtype policy {self.dtype_policy}")
+
+        if self.dtype_policy == 'pips':
+            missing = [quote + '_' + base for base, quote in self.currency_pairs
+                       if quote + '_' + base not in (self.price_decimals or {})]
+            if missing:
+                raise ValueError(f"dtype policy pips needs the price decimals of {', '.join(missing)}")
+
+        if self.MBA_candles == False:
+            self.price_candles = "M"
+        else:
+            self.price_candles = "MBA"
+
+        if self.end_date is None:
+            self.end_date = datetime.datetime.now().strftime('%Y-%m-%d')
+
+        os.makedirs(self.root, exist_ok=True)
+        self.manifest_path = os.path.join(self.root, 'manifest.json')
+
+    def settings(self):
+        '''
+        ()->(dictionary)
+        Return the settings recorded in the manifest
+        '''
+        return {'MBA_candles': self.MBA_candles, 'slice_days': self.slice_days,
+                'complete_only': self.complete_only, 'dtype_policy': self.dtype_policy,
+                'price_decimals': self.price_decimals}
+
+    def plan_slices(self):
+        '''
+        ()->(list of tuples)
+        Return the (from, to) "YYYY-MM-DD" date pairs of the slices covering start_date to end_date
+        '''
+        epoch = datetime.date(1970, 1, 1)
+        first = (datetime.date.fromisoformat(self.start_date) - epoch).days // self.slice_days
+        last = -(-(datetime.date.fromisoformat(self.end_date) - epoch).days // self.slice_days)
+
+        return [((epoch + datetime.timedelta(days=n * self.slice_days)).isoformat(),
+                 (epoch + datetime.timedelta(days=(n + 1) * self.slice_days)).isoformat()) for n in range(first, last)]
+
+    def plan_tasks(self):
+        '''
+        ()->(list of dictionaries)
+        Return one task per (instrument, granularity, slice), in time order per instrument and granularity
+        '''
+        tasks = []
+        slices = self.plan_slices()
+
+        for base_currency, quote_currency in self.currency_pairs:
+            instrument = str(quote_currency + '_' + base_currency)
+            for time_interval in self.time_intervals:
+                for start, end in slices:
+                    tasks.append({'id': task_id(instrument, time_interval, self.price_candles, start, end),
+                                  'base_currency': base_currency,
+                                  'quote_currency': quote_currency,
+                                  'instrument': instrument,
+                                  'granularity': time_interval,
+                                  'start': start,
+                                  'end': end})
+
+        return tasks
+
+    def load_manifest(self):
+        '''
+        ()->(dictionary)
+        Return the manifest in root, a new empty manifest if there is none. Raises ValueError if it was written with
+        different settings
+        '''
+        if not os.path.exists(self.manifest_path):
+            return {'version': MANIFEST_VERSION, 'settings': self.settings(), 'tasks': {}}
+
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+
+        if manifest['version'] != MANIFEST_VERSION:
+            raise ValueError(f"unsupported manifest version {manifest['version']}")
+
+        for key in MANIFEST_SETTINGS:
+            if manifest['settings'].get(key) != self.settings()[key]:
+                raise ValueError(f"{self.manifest_path} was written with {key}={manifest['settings'].get(key)!r}, "
+                                 f"not {self.settings()[key]!r}. Use the same settings or another root")
+
+        return manifest
+
+    def save_manifest(self):
+        '''
+        ()->(None)
+        Write the manifest to a temporary file and move it into place
+        '''
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+    def slice_path(self, task):
+        '''
+        (dictionary)->(str)
+        Return the save_columnar directory of a task
+        '''
+        return os.path.join(self.root, f"{task['instrument']}_{task['granularity']}_{self.price_candles}",
+                            f"{task['start'].replace('-', '')}_{task['end'].replace('-', '')}")
+
+    def run(self):
+        '''
+        ()->(dictionary)
+        Download every task that is not done on the process pool, writing the manifest after each finished task.
+        Failed tasks are recorded and the other tasks carry on. Returns summary()
+        '''
+        self.manifest = self.load_manifest()
+        entries = self.manifest['tasks']
+
+        todo = []
+        for task in self.plan_tasks():
+            entry = entries.setdefault(task['id'], {'status': 'pending', 'rows': None, 'seconds': None, 'attempts': 0, 'error': None})
+            #a done slice deleted from disk is downloaded again
+            if entry['status'] != 'done' or not os.path.exists(os.path.join(self.slice_path(task), 'schema.json')):
+                entry['status'] = 'pending' if entry['status'] == 'done' else entry['status']
+                todo.append(task)
+
+        self.save_manifest()
+        logger.info("backfill of %s tasks, %s to do on %s processes", len(entries), len(todo), self.processes)
+
+        if not todo:
+            return self.summary()
+
+        #fail here rather than in every worker initializer when the API key is not set
+        if self.client_factory is None:
+            oanda_api_key()
+
+        settings = {'MBA_candles': self.MBA_candles, 'complete_only': self.complete_only, 'dtype_policy': self.dtype_policy,
+                    'price_decimals': self.price_decimals}
+        requests_per_second = self.requests_per_second / self.processes if self.requests_per_second is not None else None
+
+        with ProcessPoolExecutor(max_workers=self.processes, initializer=init_worker,
+                                 initargs=(self.client_factory, requests_per_second)) as executor:
+            futures = {executor.submit(backfill_slice, task, self.slice_path(task), settings): task for task in todo}
+
+            try:
+                for future in as_completed(futures):
+                    task = futures[future]
+                    entry = entries[task['id']]
+                    entry['attempts'] += 1
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as ex:
+                        entry.update(status='failed', error=str(ex))
+                        logger.warning("%s failed: %s", task['id'], entry['error'])
+                    else:
+                        entry.update(result, error=None)
+                        logger.info("%s %s, %s rows in %.1fs", task['id'], entry['status'], entry['rows'], entry['seconds'])
+                    self.save_manifest()
+            except BaseException:
+                #interrupted or a worker died - tasks in flight stay pending, the next run picks them up
+                for future in futures:
+                    future.cancel()
+                raise
+
+        return self.summary()
+
+    def summary(self):
+        '''
+        ()->(dictionary)
+        Return the number of tasks per status in the manifest
+        '''
+        manifest = getattr(self, 'manifest', None) or self.load_manifest()
+        counts = {'pending': 0, 'done': 0, 'open': 0, 'failed': 0}
+
+        for entry in manifest['tasks'].values():
+            counts[entry['status']] += 1
+
+        return counts
+
+    def load_slices(self, base_currency, quote_currency, time_interval, mmap = True):
+        '''
+        (str, str, str, bool)->(pandas dataframe)
+        Return the written slices of an (instrument, granularity) between start_date and end_date as one Time indexed
+        dataframe, in time order. Slices not yet written are missing from the result
+        '''
+        instrument = str(quote_currency + '_' + base_currency)
+        frames = []
+
+        for start, end in self.plan_slices():
+            task = {'instrument': instrument, 'granularity': time_interval, 'start': start, 'end': end}
+            path = self.slice_path(task)
+            if os.path.exists(os.path.join(path, 'schema.json')):
+                frames.append(load_columnar(path, mmap))
+
+        if not frames:
+            return None
+
+        df = pd.concat(frames)
+
+        return df[(df.index >= pd.Timestamp(self.start_date)) & (df.index < pd.Timestamp(self.end_date))]
+
+
+def task_id(instrument, granularity, price, start, end):
+    '''
+    (str, str, str, str, str)->(str)
+    Return the manifest key of a task
+    '''
+    return f"{instrument}_{granularity}_{price}_{start}_{end}"
+
+
+#client of the current worker process, set by init_worker
+worker_client = None
+
+def init_worker(client_factory, requests_per_second):
+    '''
+    (function, float)->(None)
+    Process pool initializer, create the worker's client with its share of the rate limit
+    '''
+    global worker_client
+
+    client = client_factory() if client_factory is not None else shared_client()
+    worker_client = RequestScheduler(client, requests_per_second)
+
+def backfill_slice(task, path, settings):
+    '''
+    (dictionary, str, dictionary)->(dictionary)
+    Worker process task, download one slice with OandaHistoricCandles and write it to path with save_columnar.
+    Returns the manifest fields of the finished task
+    '''
+    started = time.perf_counter()
+
+    try:
+        reader = OandaHistoricCandles(task['base_currency'], task['quote_currency'], task['granularity'],
+                                      settings['MBA_candles'], task['start'], task['end'], settings['complete_only'],
+                                      client=worker_client, dtype_policy=settings['dtype_policy'],
+                                      price_decimals=(settings['price_decimals'] or {}).get(task['instrument']))
+        df = reader.extract_candles()
+
+        save_columnar(df, path)
+    except Exception as ex:
+        #exceptions are pickled back to the parent and V20Error can not be unpickled, which would break the pool.
+        #Send the error as text instead
+        raise RuntimeError(f"{type(ex).__name__}: {ex}") from None
+
+    #a slice ending after now is still growing and is downloaded again next time
+    status = 'done' if reader.end_date <= time.time() else 'open'
+
+    return {'status': status, 'rows': len(df), 'seconds': time.perf_counter() - started}
+
+
+def main(argv = None):
+    '''
+    Command line entry point, trade-read-backfill
+    '''
+    parser = argparse.ArgumentParser(prog='trade-read-backfill',
+                                     description='Backfill Oanda candle history on a process pool, resumable. '
+                                                 'Needs the OANDA_API_KEY environment variable')
+    parser.add_argument('root', help='output directory, holding manifest.json and the slices')
+    parser.add_argument('--instruments', required=True, help='comma separated instruments e.g. EUR_USD,GBP_USD')
+    parser.add_argument('--granularities', required=True, help='comma separated granularities e.g. S5,M1,H4')
+    parser.add_argument('--start', required=True, help='start date YYYY-MM-DD')
+    parser.add_argument('--end', default=None, help='end date YYYY-MM-DD. Default today')
+    parser.add_argument('--mba', action='store_true', help='read mid, bid and ask candles. Default mid only')
+    parser.add_argument('--slice-days', type=int, default=30, help='days per slice. Default 30')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes. Default the number of CPUs')
+    parser.add_argument('--requests-per-second', type=float, default=100, help='rate limit over all processes. Default 100')
+    parser.add_argument('--dtype-policy', default='float64', choices=list(CANDLE_DTYPE_POLICIES), help='Default float64')
+    parser.add_argument('--price-decimals', default=None,
+                        help='price decimals per instrument for --dtype-policy pips e.g. EUR_USD=5,USD_JPY=3')
+    parser.add_argument('--status', action='store_true', help='print the task counts of the manifest and exit')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log every finished slice')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(message)s')
+    if args.verbose:
+        logger.setLevel(logging.INFO)
+
+    #instruments are QUOTE_BASE as in the Oanda API, the readers take (base, quote) pairs
+    currency_pairs = [tuple(reversed(instrument.strip().upper().split('_'))) for instrument in args.instruments.split(',')]
+
+    price_decimals = None
+    if args.price_decimals:
+        try:
+            pairs = [item.split('=') for item in args.price_decimals.split(',')]
+            price_decimals = {instrument.strip().upper(): int(decimals) for instrument, decimals in pairs}
+        except ValueError:
+            parser.error(f"--price-decimals {args.price_decimals!r} is not of the form EUR_USD=5,USD_JPY=3")
+
+    try:
+        backfill = OandaBackfill(currency_pairs, args.granularities.split(','), args.mba, args.start, args.end,
+                                 args.root, slice_days=args.slice_days, processes=args.processes,
+                                 requests_per_second=args.requests_per_second, dtype_policy=args.dtype_policy,
+                                 price_decimals=price_decimals)
+        summary = backfill.summary() if args.status else backfill.run()
+    except (KeyError, ValueError) as ex:
+        parser.error(ex.args[0])
+    print(' '.join(f"{status}={count}" for status, count in summary.items()))
+
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-instrument batch download of Oanda candles
+"""
+
+
+###########################################
+#import libraries
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from trade_read.oanda_read import OandaHistoricCandles, OandaRecentCandles, oanda_granularity_seconds
+from trade_read.oanda_client import shared_client, RequestScheduler
+
+
+class OandaBatchCandles():
+    """
+    Class to download candles for many instruments and granularities at once using the Oanda API
+
+    All instruments share one connection pooled client. Every request window of every instrument is scheduled on a
+    single thread pool and passes through one RequestScheduler - token bucket rate limit, retries and metrics.
+
+    Keyword Args:
+    currency pairs: list of (base currency, quote currency) tuples e.g. [('USD','EUR'), ('USD','GBP')] - Required
+    Time Intervals: list of granularities e.g. ['H1','D'] - Required
+    Price Candles options 'M' or 'MBA' - 'mid', 'bid','ask'
+    Start Date - format "YYYY-MM-DD", required by extract_candles
+    End Date - format "YYYY-MM-DD". if None then read up to datetime now()
+    No Candles - number of most recent candles, required by get_candles
+    Max Workers - number of requests in flight across all instruments. Default 8
+    Requests Per Second - rate limit of the batch scheduler. Default 100
+    Store - OandaCandleStore instance shared by all instruments, see OandaHistoricCandles. Default None
+    Resample - extract_candles downloads only the finest granularity of each instrument and derives the coarser
+    granularities locally, see OandaHistoricCandles.extract_resampled. Default False
+    Client - oandapyV20 API compatible client. If None the shared pooled client, with at least max_workers connections.
+    A RequestScheduler is used as it is, any other client is wrapped in a RequestScheduler of requests_per_second
+    Dtype Policy - 'float64', 'float32' or 'pips', memory representation of every dataframe, see compact_candles.
+    Default 'float64'
+    Instrumentation - Instrumentation instance shared by every reader of the batch. Default None, disabled
+
+    ***NOTE*** TIME SETTINGS ARE UTC, REF ZERO HOURS
+
+    Functions
+    extract_candles -> historic candles between start and end date for every (instrument, granularity)
+
+    get_candles -> last no_candles candles for every (instrument, granularity)
+
+    Both return a dictionary of dataframes keyed by (instrument, granularity), or with long_format=True a single
+    dataframe indexed by (Instrument, Granularity, Time)
+    """
+
+    def __init__(self,
+        currency_pairs = None,
+        time_intervals = None,
+        MBA_candles = False,
+        start_date = None,
+        end_date = None,
+        no_candles = None,
+        complete_only = True,
+        max_workers = 8,
+        requests_per_second = 100,
+        store = None,
+        resample = False,
+        client = None,
+        dtype_policy = 'float64',
+        instrumentation = None
+        ):
+
+        #set variables to  class self
+        self.currency_pairs = currency_pairs
+        self.time_intervals = time_intervals
+        self.MBA_candles = MBA_candles
+        self.start_date = start_date
+        self.end_date = end_date
+        self.no_candles = no_candles
+        self.complete_only = complete_only
+        self.max_workers = max_workers
+        self.store = store
+        self.resample = resample
+        self.dtype_policy = dtype_policy
+        self.instrumentation = instrumentation
+
+        if client is None:
+            client = shared_client(pool_size=max_workers)
+
+        #every instrument requests through the same scheduler, self.client.metrics() reports the whole batch
+        if not isinstance(client, RequestScheduler):
+            client = RequestScheduler(client, requests_per_second)
+        self.client = client
+
+    def extract_candles(self, long_format = False):
+
+        #with resample only the finest granularity is downloaded
+        time_intervals = self.time_intervals
+        if self.resample:
+            steps = oanda_granularity_seconds()
+            time_intervals = [min(self.time_intervals, key=lambda time_interval: steps[time_interval])]
+
+        readers = {}
+        for base_currency, quote_currency in self.currency_pairs:
+            for time_interval in time_intervals:
+                reader = OandaHistoricCandles(base_currency, quote_currency, time_interval, self.MBA_candles,
+                                              self.start_date, self.end_date, self.complete_only,
+                                              max_workers=self.max_workers, store=self.store, client=self.client,
+                                              dtype_policy=self.dtype_policy, instrumentation=self.instrumentation)
+                readers[(reader.currency_pair, time_interval)] = reader
+
+        #plan every reader's windows first, then schedule all of them on one pool
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+            for key, reader in readers.items():
+                reader.windows = reader.plan_windows()
+                futures[key] = [executor.submit(reader.fetch_window, window) for window in reader.windows]
+
+            self.results = {key: readers[key].build_dataset([f.result() for f in futures[key]]) for key in readers}
+
+        if self.resample:
+            for (instrument, time_interval), reader in readers.items():
+                derived = reader.derive_resampled(self.results[(instrument, time_interval)], self.time_intervals)
+                for derived_interval, df in derived.items():
+                    self.results[(instrument, derived_interval)] = df
+
+        return self.combine(long_format)
+
+    def get_candles(self, long_format = False):
+
+        readers = {}
+        for base_currency, quote_currency in self.currency_pairs:
+            for time_interval in self.time_intervals:
+                reader = OandaRecentCandles(base_currency, quote_currency, time_interval, self.MBA_candles,
+                                            self.no_candles, self.complete_only, client=self.client,
+                                            dtype_policy=self.dtype_policy, instrumentation=self.instrumentation)
+                readers[(reader.currency_pair, time_interval)] = reader
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {key: executor.submit(reader.get_candles) for key, reader in readers.items()}
+            self.results = {key: futures[key].result() for key in readers}
+
+        return self.combine(long_format)
+
+    def combine(self, long_format = False):
+        '''
+        (bool)->(dict or pandas dataframe)
+        Return the results dictionary, or a single long format dataframe indexed by (Instrument, Granularity, Time)
+        '''
+        if not long_format:
+            return self.results
+
+        return pd.concat(self.results, names=['Instrument', 'Granularity'])
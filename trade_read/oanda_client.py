@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+Shared Oanda API client helpers - credentials, connection pooling and request rate limiting
+"""
+
+
+###########################################
+#import libraries
+from oandapyV20 import API
+from oandapyV20.exceptions import V20Error
+from email.utils import parsedate_to_datetime
+import requests
+import threading
+import random
+import time
+import os
+from trade_read.instrumentation import instrumentation_hook
+
+
+def oanda_api_key():
+    '''
+    ()->(str)
+    Return the OANDA_API_KEY environment variable, raises KeyError if it is not set
+    '''
+    api_key = os.environ.get('OANDA_API_KEY')
+
+    if api_key is None:
+        raise KeyError("OANDA_API_KEY environment variable is not set")
+
+    #strip apostrophes from string
+    return api_key.replace("'", "")
+
+def oanda_account_id():
+    '''
+    ()->(str)
+    Return the OANDA_ACCOUNT_ID environment variable, None if it is not set
+    '''
+    return os.environ.get('OANDA_ACCOUNT_ID')
+
+
+#process wide registry of pooled clients keyed by (api key, environment), with the pool size each was mounted with
+shared_clients = {}
+shared_clients_lock = threading.Lock()
+
+def shared_client(api_key = None, environment = 'practice', pool_size = 10):
+    '''
+    (str, str, int)->(oandapyV20 API)
+    Return the process wide pooled client for (api_key, environment), created on first use.
+    If api_key is None the OANDA_API_KEY environment variable is used.
+    Requesting a larger pool_size than the existing client was built with enlarges its connection pool.
+    The registry is lock protected and the requests connection pool is thread safe, so the client can be shared by
+    any number of readers and threads.
+    '''
+    if api_key is None:
+        api_key = oanda_api_key()
+
+    key = (api_key, environment)
+
+    with shared_clients_lock:
+        if key not in shared_clients:
+            shared_clients[key] = (pooled_client(api_key, pool_size, environment), pool_size)
+
+        client, size = shared_clients[key]
+        if pool_size > size:
+            mount_pool(client, pool_size)
+            shared_clients[key] = (client, pool_size)
+
+    return client
+
+def close_shared_clients():
+    '''
+    ()->(None)
+    Close the sessions of every shared client and empty the registry, shared schedulers are dropped with them
+    '''
+    with shared_clients_lock:
+        for client, size in shared_clients.values():
+            client.close()
+        shared_clients.clear()
+        shared_schedulers.clear()
+
+
+#process wide RequestScheduler per (api key, environment), wrapping the shared client
+shared_schedulers = {}
+
+def shared_scheduler(api_key = None, environment = 'practice'):
+    '''
+    (str, str)->(RequestScheduler)
+    Return the process wide RequestScheduler for (api_key, environment), created on first use with the default rate
+    limit around shared_client(api_key, environment). The readers send their requests through it by default, so every
+    reader in the process counts against one rate limit and one set of metrics.
+    '''
+    if api_key is None:
+        api_key = oanda_api_key()
+
+    client = shared_client(api_key, environment)
+    key = (api_key, environment)
+
+    with shared_clients_lock:
+        if key not in shared_schedulers:
+            shared_schedulers[key] = RequestScheduler(client)
+
+        return shared_schedulers[key]
+
+
+def pooled_client(api_key, pool_size = 10, environment = 'practice'):
+    '''
+    (str, int, str)->(oandapyV20 API)
+    Return an oandapyV20 API client whose HTTP session keeps up to pool_size keep-alive connections open,
+    so that many threads can share it without opening a new connection (and TLS handshake) per request
+    '''
+    client = API(api_key, environment=environment)
+
+    mount_pool(client, pool_size)
+
+    #make the Retry-After header of throttled responses available to RequestScheduler, and report response timings
+    #and sizes to the active Instrumentation
+    client.client.hooks['response'].append(retry_after_hook)
+    client.client.hooks['response'].append(instrumentation_hook)
+
+    return client
+
+def mount_pool(client, pool_size):
+    '''
+    (oandapyV20 API, int)->(None)
+    Mount a keep-alive connection pool of pool_size connections on the client's requests session
+    '''
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    client.client.mount('https://', adapter)
+
+
+class TokenBucket():
+    """
+    Thread safe token bucket rate limiter. Tokens refill at rate per second up to burst, every acquire() takes one.
+    Callers that find the bucket empty reserve a future token and sleep until it is due, so waiting threads are served
+    in order and the long run rate never exceeds rate.
+
+    Keyword Args:
+    rate - tokens added per second. Default 100
+    burst - bucket capacity, the number of requests that may be sent back to back. Default rate
+
+    Functions
+    acquire -> block until a token is available, returns the seconds waited
+
+    pause -> hold every caller for a number of seconds, e.g. after a 429 with Retry-After
+    """
+
+    def __init__(self, rate = 100, burst = None):
+
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        ()->(float)
+        Take one token, sleeping until it is due. Returns the seconds waited
+        '''
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+
+            #tokens may go negative, each waiting caller holds a reservation one refill interval after the previous
+            self.tokens -= 1
+            wait = max(0.0, -self.tokens / self.rate, self.paused_until - now)
+
+        if wait > 0:
+            time.sleep(wait)
+
+        return wait
+
+    def pause(self, seconds):
+        '''
+        (float)->(None)
+        Hold every acquire() for at least seconds from now
+        '''
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+#Retry-After of the last throttled response, per thread as each request runs in the calling thread
+retry_after_local = threading.local()
+
+def retry_after_hook(response, *args, **kwargs):
+    '''
+    (requests Response)->(None)
+    requests session response hook, records the Retry-After header of 429 and 503 responses for last_retry_after
+    '''
+    if response.status_code in (429, 503):
+        retry_after_local.value = parse_retry_after(response.headers.get('Retry-After'))
+
+def last_retry_after():
+    '''
+    ()->(float)
+    Return and clear the Retry-After seconds recorded for the calling thread, None if there was none
+    '''
+    value = getattr(retry_after_local, 'value', None)
+    retry_after_local.value = None
+
+    return value
+
+def parse_retry_after(value):
+    '''
+    (str)->(float)
+    Convert a Retry-After header, delay seconds or an HTTP date, to seconds from now. None if missing or invalid
+    '''
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, retry_backoff = 1.0, max_backoff = 60.0, retry_after = None):
+    '''
+    (int, float, float, float)->(float)
+    Return the delay before retry number attempt (0 based). Exponential backoff capped at max_backoff with equal
+    jitter, half the delay fixed and half random, so clients retrying together spread out. A Retry-After from the server
+    is a lower bound.
+    '''
+    delay = min(max_backoff, retry_backoff * 2 ** attempt)
+    delay = delay / 2 + random.uniform(0, delay / 2)
+
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+
+    return delay
+
+
+class RequestScheduler():
+    """
+    Request layer shared by the Oanda readers, wrapping an oandapyV20 API compatible client.
+    Every request waits on a token bucket, and 429, 5xx and connection errors are retried with jittered exponential
+    backoff. A 429 pauses the whole bucket for the server's Retry-After (or the backoff delay), so no other thread keeps
+    hitting the limit meanwhile.
+
+    Keyword Args:
+    client - Required, client with a request(endpoint) method. Retry-After is read when it is a pooled_client
+    requests_per_second - token bucket rate, None = no rate limit. Default 100
+    burst - token bucket capacity. Default requests_per_second
+    max_retries - retries before the error is raised to the caller. Default 5
+    retry_backoff - initial backoff delay in seconds, doubled per retry. Default 1.0
+    max_backoff - backoff delay cap in seconds. Default 60.0
+
+    Functions
+    request -> send a request through the bucket and retry policy
+
+    metrics -> snapshot of the counters: requests sent, successes, retries, throttled (429), server_errors (5xx),
+    connection_errors, throttle_wait (seconds waiting on the bucket) and backoff_wait (seconds sleeping before retries)
+    """
+
+    def __init__(self, client = None, requests_per_second = 100, burst = None, max_retries = 5, retry_backoff = 1.0, max_backoff = 60.0):
+
+        self.client = client
+        self.bucket = TokenBucket(requests_per_second, burst) if requests_per_second is not None else None
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+
+        session = getattr(client, 'client', None)
+        if isinstance(session, requests.Session) and retry_after_hook not in session.hooks['response']:
+            session.hooks['response'].append(retry_after_hook)
+
+        self.lock = threading.Lock()
+        self.reset_metrics()
+
+    def request(self, endpoint, max_retries = None, retry_backoff = None):
+        '''
+        (oandapyV20 APIRequest, int, float)->(dictionary)
+        Send the request, retrying on 429, 5xx and connection errors. Any other error, or the last failed attempt, is
+        raised. max_retries and retry_backoff override the scheduler defaults for this request.
+        '''
+        if max_retries is None:
+            max_retries = self.max_retries
+        if retry_backoff is None:
+            retry_backoff = self.retry_backoff
+
+        attempt = 0
+
+        while True:
+            if self.bucket is not None:
+                self.count('throttle_wait', self.bucket.acquire())
+
+            self.count('requests')
+            last_retry_after()
+
+            try:
+                response = self.client.request(endpoint)
+                self.count('successes')
+                return response
+            except V20Error as ex:
+                if ex.code != 429 and ex.code < 500:
+                    raise
+                self.count('throttled' if ex.code == 429 else 'server_errors')
+                if attempt >= max_retries:
+                    raise
+                delay = backoff_delay(attempt, retry_backoff, self.max_backoff, last_retry_after())
+                if ex.code == 429 and self.bucket is not None:
+                    self.bucket.pause(delay)
+            except requests.RequestException:
+                self.count('connection_errors')
+                if attempt >= max_retries:
+                    raise
+                delay = backoff_delay(attempt, retry_backoff, self.max_backoff)
+
+            self.count('retries')
+            self.count('backoff_wait', delay)
+            time.sleep(delay)
+            attempt += 1
+
+    def count(self, name, value = 1):
+        '''
+        (str, float)->(None)
+        Add value to a counter
+        '''
+        with self.lock:
+            self.counters[name] += value
+
+    def metrics(self):
+        '''
+        ()->(dictionary)
+        Return a snapshot of the counters
+        '''
+        with self.lock:
+            return dict(self.counters)
+
+    def reset_metrics(self):
+        '''
+        ()->(None)
+        Set every counter to zero
+        '''
+        with self.lock:
+            self.counters = {'requests': 0, 'successes': 0, 'retries': 0, 'throttled': 0, 'server_errors': 0,
+                             'connection_errors': 0, 'throttle_wait': 0.0, 'backoff_wait': 0.0}
@@ -9,22 +9,41 @@ Created on Mon Apr  3 08:18:53 2023
 ###########################################
 #import libraries
 import pandas as pd
-from oandapyV20 import API 
+import numpy as np
+from operator import itemgetter
 import oandapyV20.endpoints.instruments as instruments
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from itertools import islice
 import os
 import time
 import datetime
-#import requests
+import logging
+from trade_read.instrumentation import stage
+from trade_read.oanda_client import oanda_api_key, oanda_account_id, shared_scheduler, RequestScheduler
 
 ##########################################
-#import account password, ID number, api key
+#account password, ID number, api key
 #USER REQUIRED TO STORE IN ENVIRONMENT VARIABLES OR SIMILAR
-account_pwd = os.environ.get('OANDA_API_PASSWORD')
-account_id = os.environ.get('OANDA_ACCOUNT_ID')
-api_key = os.environ.get('OANDA_API_KEY')
+#credentials are read by oanda_client when a client is first built, not at import, so the package imports without them
 
-#strip apostrophes from string
-api_key = api_key.replace("'", "")
+def __getattr__(name):
+    #module level api_key, account_id and account_pwd are kept for existing callers, resolved on first access.
+    #A missing key is an AttributeError, so hasattr and getattr with a default work
+    if name == 'api_key':
+        try:
+            return oanda_api_key()
+        except KeyError as ex:
+            raise AttributeError(ex.args[0]) from ex
+    if name == 'account_id':
+        return oanda_account_id()
+    if name == 'account_pwd':
+        return os.environ.get('OANDA_API_PASSWORD')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+#page read messages are logged at INFO, e.g. logging.basicConfig(level=logging.INFO) to see download progress
+logger = logging.getLogger(__name__)
 
 
 #print(os.environ.get('OANDA_API_KEY'))
@@ -41,10 +60,24 @@ class OandaRecentCandles():
     quote currency: e,g EUR - Required
     Time Interval e.g H4 - refers to granularity in OandaAPI
     Price Candles options 'M' or 'MBA' - 'mid', 'bid','ask'
+    Client - oandapyV20 API compatible client with a request(endpoint) method. If None the process wide
+    RequestScheduler (rate limit, retries, metrics) of the shared pooled client is used
+    Dtype Policy - 'float64', 'float32' or 'pips', memory representation of the candles, see compact_candles.
+    Default 'float64'
+    Price Decimals - decimals of the 'pips' prices, e.g. 5 for EUR_USD. If None it is inferred from the first non
+    empty response, a later response with more decimals raises ValueError. Default None
+    Instrumentation - Instrumentation instance collecting stage timings and counters. Default None, disabled
 
     ***NOTE*** TIME SETTINGS ARE UTC, REF ZERO HOURS
 
     Functions
+    get_candles -> download the last no_candles candles
+
+    poll -> incremental update of a tail buffer of the last no_candles candles. Only the candles from the last
+    complete candle onwards are requested, new bars are appended and the forming bar is replaced
+
+    follow -> generator calling poll at every candle close of the granularity, yields the updated candles
+
     time_interval_id -> returns dictionary of time intervals untis to skip based upon the key value
 
     time_first_return -> determines first entry date for a coin held on the binance database. Use 1 day timeframe as default
@@ -64,7 +97,11 @@ class OandaRecentCandles():
             MBA_candles = False,
             no_candles = None, 
             #price_candles = None,
-            complete_only = True    
+            complete_only = True,
+            client = None,
+            dtype_policy = 'float64',
+            price_decimals = None,
+            instrumentation = None
             ):
 
             #set variables to  class self
@@ -75,6 +112,14 @@ class OandaRecentCandles():
             self.no_candles = no_candles
             #self.price_candles = price_candles
             self.complete_only = complete_only
+            self.dtype_policy = dtype_policy
+            self.instrumentation = instrumentation
+
+            if self.dtype_policy not in CANDLE_DTYPE_POLICIES:
+                raise ValueError(f"Unknown dtype policy {self.dtype_policy}")
+
+            #price decimals of the instrument, if None fixed on the first response when dtype_policy is 'pips'
+            self.price_decimals = price_decimals
 
             #create trading pair from base and quote currency
             self.currency_pair = str( self.quote_currency + '_' + self.base_currency)   
@@ -95,41 +140,135 @@ class OandaRecentCandles():
 
             granularity_list = oanda_granularity_list()
 
-            #connect to oanda API      
-            self.client = API(api_key)
+            #tail buffer used by poll/follow - last no_candles candles indexed by Time, including the forming candle
+            self.tail = None
+
+            #connect to oanda API through the process wide request scheduler, unless a client (e.g. a local stub) has been supplied
+            if client is None:
+                self.client = shared_scheduler()
+            else:
+                self.client = client
 
 
     def get_candles(self):
 
         r=instruments.InstrumentsCandles(instrument=self.currency_pair,params=self.params)
 
-        data = self.client.request(r)
+        with stage(self.instrumentation, 'request'):
+            data = self.client.request(r)
         #print(data)
-            
-        if self.MBA_candles == False:
-            results= [{"Time":x['time'],"Open":float(x['mid']['o']),"High":float(x['mid']['h']),
-                    "Low":float(x['mid']['l']),"Close":float(x['mid']['c']),
-                    "Volume":float(x['volume']),"Complete":x['complete']} for x in data['candles']]
-        else:
-            results= [{"Time":x['time'],"Open":float(x['mid']['o']),"High":float(x['mid']['h']),
-                    "Low":float(x['mid']['l']),"Close":float(x['mid']['c']),
-                    "Open Bid":float(x['bid']['o']),"High Bid":float(x['bid']['h']),
-                    "Low Bid":float(x['bid']['l']),"Close Bid":float(x['bid']['c']),
-                    "Open Ask":float(x['ask']['o']),"High Ask":float(x['ask']['h']),
-                    "Low Ask":float(x['ask']['l']),"Close Ask":float(x['ask']['c']),
-                    "Volume":float(x['volume']),"Complete":x['complete']} for x in data['candles']]
-
-        self.df = pd.DataFrame(results)
-        
 
+        return self.candles_frame(data)
+
+    def candles_frame(self, data):
+        '''
+        (dictionary)->(pandas dataframe)
+        Build the get_candles dataframe from an InstrumentsCandles response
+        '''
+        self.df = self.compact(parse_candles(data['candles'], self.MBA_candles, self.instrumentation))
 
         if self.complete_only == True:
             self.df = self.df[self.df.Complete == True]
 
-        self.df['Time'] = pd.to_datetime(self.df.Time, format="%Y-%m-%dT%H:%M:%S.%fZ")
         self.df.set_index('Time', inplace=True)
 
         return self.df
+
+    def poll(self):
+        '''
+        ()->(pandas dataframe)
+        Update the tail buffer and return the last no_candles candles, same schema as get_candles.
+        The first call requests no_candles candles, later calls request from the last complete candle onwards only.
+        '''
+        params = self.poll_params()
+
+        r=instruments.InstrumentsCandles(instrument=self.currency_pair,params=params)
+
+        with stage(self.instrumentation, 'request'):
+            data = request_with_retry(self.client, r)
+
+        return self.update_tail(params, data)
+
+    def poll_params(self):
+        '''
+        ()->(dictionary)
+        Return the request params of the next poll
+        '''
+        params = dict(self.params)
+
+        if self.tail is not None:
+            complete = self.tail.index[self.tail.Complete.values]
+            if len(complete):
+                #from + count paging, count is the largest page Oanda allows and only candles up to now are returned
+                params['from'] = str(int(complete[-1].value // 10**9))
+                params['count'] = 5000
+
+        return params
+
+    def update_tail(self, params, data):
+        '''
+        (dictionary, dictionary)->(pandas dataframe)
+        Merge a poll response into the tail buffer and return the last no_candles candles
+        '''
+        new = self.compact(parse_candles(data['candles'], self.MBA_candles, self.instrumentation)).set_index('Time')
+
+        if self.tail is None or 'from' not in params:
+            self.tail = new
+        elif not new.empty:
+            #keep the buffered candles before the first returned candle, returned candles replace or extend the rest
+            self.tail = pd.concat([self.tail[self.tail.index < new.index[0]], new])
+
+        self.tail = self.tail.iloc[-self.no_candles:]
+
+        self.df = self.tail
+        if self.complete_only == True:
+            self.df = self.df[self.df.Complete == True]
+
+        return self.df.copy()
+
+    def compact(self, df):
+        '''
+        (pandas dataframe)->(pandas dataframe)
+        Apply the dtype policy to a parsed response, every response of the instance uses the same price decimals
+        '''
+        if self.dtype_policy == 'pips' and self.price_decimals is None and not df.empty:
+            self.price_decimals = candle_price_decimals(df)
+
+        return compact_candles(df, self.dtype_policy, self.price_decimals)
+
+    def next_poll_time(self):
+        '''
+        ()->(float)
+        Return the unix timestamp of the next candle close of the granularity, after the last buffered candle
+        '''
+        step = oanda_granularity_seconds()[self.time_interval]
+        now = time.time()
+
+        if self.tail is None or self.tail.empty:
+            return now
+
+        #the last buffered candle is the forming candle, it closes one step after it opened
+        next_close = self.tail.index[-1].value / 10**9 + step
+        if next_close <= now:
+            next_close += step * (int((now - next_close) // step) + 1)
+
+        return next_close
+
+    def follow(self, poll_delay = 1.0, max_polls = None):
+        '''
+        (float, int)->(generator of pandas dataframes)
+        Poll after every candle close and yield the updated last no_candles candles.
+        poll_delay - seconds waited after the candle close, giving Oanda time to complete the candle. Default 1.0
+        max_polls - stop after this number of polls. Default None, follow until the generator is closed
+        '''
+        polls = 0
+
+        while max_polls is None or polls < max_polls:
+            yield self.poll()
+            polls += 1
+
+            if max_polls is None or polls < max_polls:
+                time.sleep(max(0.0, self.next_poll_time() + poll_delay - time.time()))
             
 
 class OandaHistoricCandles():
@@ -145,6 +284,28 @@ class OandaHistoricCandles():
     Price Candles options 'M' or 'MBA' - 'mid', 'bid','ask'
     Start Date - Required, format "YYYY-MM-DD"
     End Date - , format "YYYY-MM-DD". if None then read up to datetime now()
+    Max Workers - number of request windows fetched concurrently, 1 = sequential. Default 1
+    Requests use Oanda's count based paging (from + count = 5000), each page starts at the last candle time actually
+    returned, so weekends and market closures do not cost extra requests. Sequentially the whole range is one window,
+    with max_workers > 1 the range is split into windows of 5000 nominal candles paged in parallel.
+    Max Retries - number of retries on a 429/5xx or connection error before giving up. Default 5
+    Retry Backoff - initial retry delay in seconds, doubled on every retry with jitter. Default 1.0
+    Store - OandaCandleStore instance. If supplied only the ranges missing from the store are downloaded, new windows
+    are added to the store and the result is read back from it. Default None
+    Client - oandapyV20 API compatible client with a request(endpoint) method. If None the process wide
+    RequestScheduler (rate limit, retries, metrics) of the shared pooled client is used
+    Dtype Policy - 'float64', 'float32' or 'pips', memory representation of the dataset, see compact_candles. Every
+    page is converted as it arrives, so the full history is never held at float64. The store always holds float64.
+    Default 'float64'
+    Price Decimals - decimals of the 'pips' prices, e.g. 5 for EUR_USD. If None it is inferred from the first non
+    empty chunk, a later chunk with more decimals raises ValueError. Default None
+    Instrumentation - Instrumentation instance collecting stage timings and counters, and receiving a 'page' event per
+    page read. Default None, disabled. Pages are also logged at INFO level
+
+    Resume - if a request still fails after max_retries, calling extract_candles again continues from the last
+    successful page. Without a store the chunks already qc'd and converted to the dtype policy are checkpointed in memory
+    (a parallel read resumes at the first window not yet handed on), with a store every page is written to the store as
+    it arrives and only the missing ranges are requested again, also after a restart.
 
     ***NOTE*** TIME SETTINGS ARE UTC, REF ZERO HOURS
 
@@ -158,7 +319,15 @@ class OandaHistoricCandles():
         MBA_candles = False,
         start_date = None,
         end_date = None,
-        complete_only = True        
+        complete_only = True,
+        max_workers = 1,
+        max_retries = 5,
+        retry_backoff = 1.0,
+        store = None,
+        client = None,
+        dtype_policy = 'float64',
+        price_decimals = None,
+        instrumentation = None
         ):
 
         #set variables to  class self
@@ -169,6 +338,18 @@ class OandaHistoricCandles():
         self.start_date = start_date
         self.end_date = end_date
         self.complete_only = complete_only
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.store = store
+        self.dtype_policy = dtype_policy
+        self.instrumentation = instrumentation
+
+        if self.dtype_policy not in CANDLE_DTYPE_POLICIES:
+            raise ValueError(f"Unknown dtype policy {self.dtype_policy}")
+
+        #price decimals of the instrument, if None fixed on the first non empty chunk when dtype_policy is 'pips'
+        self.price_decimals = price_decimals
         
         #create trading pair from base and quote currency
         self.currency_pair = str( self.quote_currency + '_' + self.base_currency)
@@ -189,8 +370,8 @@ class OandaHistoricCandles():
         else:
             self.end_date = self.unix_timestamp(self.end_date)
         
-        #number of candles to read in each data request package
-        self.max_no_candles = 999
+        #number of candles to read in each data request package - the maximum count allowed by Oanda
+        self.max_no_candles = 5000
         
         #number of seconds between each data time interval is caclulated
         #e.g. S5 = 5 seconds = 5
@@ -198,12 +379,89 @@ class OandaHistoricCandles():
         #this value is used to calculate the start time of the next daat request. n + 1
         self.granularity_dict = self.time_interval_id()
 
-        #connect to oanda API      
-        self.client = API(api_key)
+        #connect to oanda API through the process wide request scheduler, unless a client (e.g. a local stub) has been supplied
+        if client is None:
+            self.client = shared_scheduler()
+        else:
+            self.client = client
+
+        #pages fetched per request window by an unfinished extract_candles, see extract_candles
+        self.checkpoint = None
 
         
     def extract_candles(self):
-        
+
+        #without a store the chunks handed on so far are checkpointed in memory, already qc'd and in the dtype policy,
+        #with the time to resume from - if a request still fails after its retries, calling extract_candles again
+        #resumes after the last chunk handed on. With a store the store is the checkpoint, every page is written to it
+        #as it arrives
+        if self.store is None and self.checkpoint is None:
+            self.checkpoint = {'chunks': [], 'resume': None, 'qc': None}
+
+        chunks = self.checkpoint['chunks'] if self.checkpoint is not None else []
+
+        #eager read - collect every chunk from the streaming iterator and combine them in a single concat
+        for df in self.iter_candles():
+            chunks.append(df)
+
+        self.concat_dataset(chunks)
+        self.checkpoint = None
+
+        return self.dataset
+
+    def iter_candles(self):
+        '''
+        ()->(generator of pandas dataframes)
+        Yield the dataset one request page (sequential) or window (max_workers > 1) at a time, in time order, with the
+        Complete filter and 'index diff' qc already applied. Only max_workers * 2 windows are held in memory at once,
+        so a caller can write each chunk to disk or feed a backtest without loading the whole history.
+        '''
+        self.windows = self.plan_windows()
+
+        #resuming an interrupted extract_candles, only the range after the last chunk handed on is fetched
+        if self.checkpoint is not None and self.checkpoint['resume'] is not None:
+            resume = self.checkpoint['resume']
+            self.windows = [(max(start, resume), end) for start, end in self.windows if end > resume]
+
+        return self.iter_dataset(self.iter_fetch(self.windows))
+
+    def iter_fetch(self, windows):
+        '''
+        (list of tuples)->(generator of iterables of pandas dataframes)
+        Fetch the windows, sequentially or on a thread pool, and yield the pages of each window in window order.
+        Sequential windows are paged lazily, a thread pool window arrives as one combined chunk.
+        '''
+        if self.max_workers <= 1:
+            for window in windows:
+                yield self.iter_window(window, self.checkpoint)
+            return
+
+        windows = iter(windows)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            #keep a bounded number of windows in flight, submit the next window as each chunk is handed on
+            pending = deque((window, executor.submit(self.fetch_window, window)) for window in islice(windows, 2 * self.max_workers))
+
+            while pending:
+                (start, end), future = pending.popleft()
+                df = future.result()
+
+                window = next(windows, None)
+                if window is not None:
+                    pending.append((window, executor.submit(self.fetch_window, window)))
+
+                yield [df]
+
+                #the window has been qc'd and handed on
+                if self.checkpoint is not None:
+                    self.save_checkpoint(end)
+
+    def plan_windows(self):
+        '''
+        ()->(list of tuples)
+        Set the request params and split the date range into the (from, to) request windows still to be downloaded.
+        Windows are planned up front so they can be fetched in any order, by this instance or by OandaBatchCandles.
+        '''
         #self.i is used to iterate over a specfied number of candles at the reqyuested time interval.
         #i is always the start/first candle in the data request
         self.i = self.start_date
@@ -220,91 +478,679 @@ class OandaHistoricCandles():
         else:
             self.price_candles = "MBA"
 
-        #params is the json data request parameter dictionary , start and end period + time interval specified
+        #params is the json data request parameter dictionary , start time, page size + time interval specified
         self.params = {
           "from": str(self.i),
-          "to": str(self.step_interval),
           "price" :str(self.price_candles),
-          #"count": 1001,
+          "count": self.max_no_candles,
           "alignmentTimezone" : 'UTC',
           'dailyAlignment': str(0),
           "granularity": str(self.time_interval)
         }
-        
-        #create empty host dataframe
-        self.dataset=pd.DataFrame()
-        
-        while self.i < self.end_date:
-            
-            self.end_step = self.i + self.step_unix
+
+        if self.store is None:
+            return self.request_windows(self.start_date, self.end_date)
+
+        #only request the gaps the local store does not already cover, the covered ranges in between are read from
+        #the store. Both are fixed here, before any new window is written to the store
+        windows = []
+        self.covered = []
+        i = self.start_date
+        for gap_start, gap_end in self.store.missing(self.currency_pair, self.time_interval, self.price_candles, self.start_date, self.end_date):
+            windows += self.request_windows(gap_start, gap_end)
+            if gap_start > i:
+                self.covered.append((i, gap_start))
+            i = gap_end
+        if i < self.end_date:
+            self.covered.append((i, self.end_date))
+
+        return windows
+
+    def build_dataset(self, chunks):
+        '''
+        (list of pandas dataframes)->(pandas dataframe)
+        Combine chunks already fetched for self.windows, in window order, into the final Time indexed dataset
+        '''
+        return self.concat_dataset(self.iter_dataset(iter([df] for df in chunks)))
+
+    def iter_dataset(self, chunks):
+        '''
+        (iterator of iterables of pandas dataframes)->(generator of pandas dataframes)
+        Interleave the fetched chunks with the ranges already held in the store and apply the per chunk qc
+        '''
+        self.start_qc()
+
+        for df in self.merge_store(chunks):
+            df = self.qc_chunk(df)
+            if not df.empty:
+                yield df
+
+    def start_qc(self):
+        '''
+        ()->(None)
+        Reset the qc state carried from chunk to chunk, or restore it from the checkpoint when resuming
+        '''
+        #timestamp of the last candle handed on, carries the 'index diff' qc across chunk boundaries
+        self.last_time = None
+        #nominal request window of the last candle handed on and the next Seq Cnt within it, see sequence_numbers
+        self.seq_window = None
+        self.seq_next = 0
+
+        if self.checkpoint is not None and self.checkpoint['resume'] is not None:
+            self.last_time, self.seq_window, self.seq_next = self.checkpoint['qc']
+
+    def dataset_pieces(self):
+        '''
+        ()->(list of tuples)
+        Return the (from, to, fetched) ranges of the dataset in time order - the request windows, and with a store the
+        covered ranges read from it
+        '''
+        if self.store is None:
+            return [(start, end, True) for start, end in self.windows]
+
+        return sorted([(start, end, False) for start, end in self.covered] + [(start, end, True) for start, end in self.windows])
+
+    def merge_store(self, chunks):
+        '''
+        (iterator of iterables of pandas dataframes)->(generator of pandas dataframes)
+        Yield the pages of the fetched windows and, when a store is used, the stored segments of the covered ranges
+        in time order
+        '''
+        if self.store is None:
+            for pages in chunks:
+                yield from pages
+            return
+
+        for start, end, fetched in self.dataset_pieces():
+            if fetched:
+                yield from next(chunks)
+            else:
+                yield from self.store.iter_read(self.currency_pair, self.time_interval, self.price_candles, start, end)
+
+    def qc_chunk(self, df):
+        '''
+        (pandas dataframe)->(pandas dataframe)
+        Apply the Complete filter and dtype policy, index on Time and add the 'index diff' qc column to a single chunk
+        '''
+        with stage(self.instrumentation, 'qc'):
+            df = df.assign(**{'Seq Cnt': self.sequence_numbers(df['Time'].values)})
+
+            if self.complete_only == True:
+                df = df[df.Complete == True]
+
+            if self.dtype_policy == 'pips' and self.price_decimals is None and not df.empty:
+                self.price_decimals = candle_price_decimals(df)
+            df = compact_candles(df, self.dtype_policy, self.price_decimals)
+
+            df = df.set_index('Time')
+
+            #qc of time intervals, the first candle is compared with the last candle of the previous chunk
+            indexqc = df.index.to_series().diff()
+            if self.last_time is not None and not df.empty:
+                indexqc.iloc[0] = df.index[0] - self.last_time
+            df['index diff'] = indexqc
+
+        if not df.empty:
+            self.last_time = df.index[-1]
+
+        return df
+
+    def sequence_numbers(self, times):
+        '''
+        (numpy datetime64 array)->(numpy int64 array)
+        Return the Seq Cnt of a chunk of candles in time order - the position of each candle in its nominal request
+        window of max_no_candles candles counted from start_date, before the Complete filter. Numbering carries across
+        chunks, so it does not depend on how the range was paged or split between workers.
+        '''
+        n = len(times)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        windows = (times.astype('datetime64[s]').astype(np.int64) - self.start_date) // self.step_unix
+        starts = np.flatnonzero(np.r_[True, windows[1:] != windows[:-1]])
+        run_lengths = np.diff(np.r_[starts, n])
+
+        #position within each run of equal windows, the first run continues the previous chunk's window
+        seq = np.arange(n) - np.repeat(starts, run_lengths)
+        if windows[0] == self.seq_window:
+            seq[:run_lengths[0]] += self.seq_next
+
+        self.seq_window = windows[-1]
+        self.seq_next = seq[-1] + 1
+
+        return seq
+
+    def concat_dataset(self, chunks):
+        '''
+        (iterable of pandas dataframes)->(pandas dataframe)
+        Combine qc'd chunks in a single concat - concatenating inside the loop copies everything read so far on every pass
+        '''
+        chunks = list(chunks)
+
+        if not chunks:
+            empty = parse_candles([], self.MBA_candles)
+            empty['Seq Cnt'] = empty.index
+            self.last_time = None
+            chunks = [self.qc_chunk(empty)]
+
+        with stage(self.instrumentation, 'concat'):
+            self.dataset = pd.concat(chunks)
+
+        return self.dataset
+
+    def request_windows(self, start, end):
+        '''
+        (int, int)->(list of tuples)
+        Split [start, end) into (from, to) unix timestamp windows. A single window when fetching sequentially,
+        otherwise windows of max_no_candles nominal candles each so they can be paged in parallel
+        '''
+        if self.max_workers <= 1:
+            return [(start, end)] if start < end else []
+
+        windows = []
+        i = start
+
+        while i < end:
             
-            if self.end_step >= self.end_date:
-                self.end_step = self.end_date
+            end_step = i + self.step_unix
             
-            #print(datetime.datetime.utcfromtimestamp(self.i).strftime('%Y-%m-%d %H:%M:%S'))
-            #print(datetime.datetime.utcfromtimestamp(self.end_step).strftime('%Y-%m-%d %H:%M:%S'))
+            if end_step >= end:
+                end_step = end
 
-            #update the params dictionary with the latest start and end time periods
-            self.params["from"] = str(self.i)
-            self.params["to"] = str(self.end_step)
-            
-         
-            r=instruments.InstrumentsCandles(instrument=self.currency_pair,params=self.params)
+            windows.append((i, end_step))
+            i = end_step
 
-            data = self.client.request(r)
+        return windows
+
+    def fetch_window(self, window):
+        '''
+        (tuple)->(pandas dataframe)
+        Request all pages of a single (from, to) window and return the raw candles as one dataframe.
+        Safe to call from worker threads.
+        '''
+        return self.combine_pages(list(self.iter_window(window)))
+
+    def combine_pages(self, pages):
+        '''
+        (list of pandas dataframes)->(pandas dataframe)
+        Combine the pages of one window, an empty window gives an empty dataframe of the same schema
+        '''
+        if not pages:
+            df = parse_candles([], self.MBA_candles)
+            df['Seq Cnt'] = df.index
+            return df
+
+        return pd.concat(pages, ignore_index=True)
+
+    def iter_window(self, window, checkpoint = None):
+        '''
+        (tuple, dictionary)->(generator of pandas dataframes)
+        Page through [from, to) with from + count requests. Each page starts at the last candle time returned by the
+        previous page and keeps only the candles before that time, so no candle is returned twice.
+        With a checkpoint the resume time is saved after each page has been handed on, see extract_candles.
+        '''
+        i, end = window
+
+        while i < end:
+
+            r = self.window_request(i)
+
+            with stage(self.instrumentation, 'request'):
+                data = request_with_retry(self.client, r, self.max_retries, self.retry_backoff)
             #print(data)
-            
-            if self.MBA_candles == False:
-                results= [{"Time":x['time'],"Open":float(x['mid']['o']),"High":float(x['mid']['h']),
-                        "Low":float(x['mid']['l']),"Close":float(x['mid']['c']),
-                        "Volume":float(x['volume']),"Complete":x['complete']} for x in data['candles']]
-            else:
-                results= [{"Time":x['time'],"Open":float(x['mid']['o']),"High":float(x['mid']['h']),
-                        "Low":float(x['mid']['l']),"Close":float(x['mid']['c']),
-                        "Open Bid":float(x['bid']['o']),"High Bid":float(x['bid']['h']),
-                        "Low Bid":float(x['bid']['l']),"Close Bid":float(x['bid']['c']),
-                        "Open Ask":float(x['ask']['o']),"High Ask":float(x['ask']['h']),
-                        "Low Ask":float(x['ask']['l']),"Close Ask":float(x['ask']['c']),
-                        "Volume":float(x['volume']),"Complete":x['complete']} for x in data['candles']]
-
-            self.df = pd.DataFrame(results)
-            self.df['Seq Cnt'] = self.df.index
-
-            print(f"Read Time Start {self.df['Time'].iloc[0]} to Tiem End {self.df['Time'].iloc[-1]}")
-            if self.dataset.empty: 
-                self.dataset=self.df.copy()
-            else: 
-                self.dataset= pd.concat([self.dataset, self.df])
-             
-            #self.i = self.step_size + self.end_step
-            self.i = self.end_step
-        
-        if self.complete_only == True:
-            self.dataset = self.dataset[self.dataset.Complete == True]
 
-        self.dataset['Time'] = pd.to_datetime(self.dataset.Time, format="%Y-%m-%dT%H:%M:%S.%fZ")
-        self.dataset.set_index('Time', inplace=True)
+            df, next_i = self.window_page(i, end, data)
 
-        #qc of time intervals
-        indexqc = self.dataset.index.to_series().diff()
-        self.dataset['index diff'] = indexqc
+            yield df
+            i = next_i
 
-        return self.dataset
+            if checkpoint is not None:
+                self.save_checkpoint(i)
+
+    def save_checkpoint(self, resume):
+        '''
+        (int)->(None)
+        Record that every candle before unix timestamp resume has been qc'd and handed on, with the qc state carried
+        into the next chunk
+        '''
+        self.checkpoint['resume'] = resume
+        self.checkpoint['qc'] = (self.last_time, self.seq_window, self.seq_next)
+
+    def window_request(self, i):
+        '''
+        (int)->(oandapyV20 InstrumentsCandles)
+        Return the request of the page starting at unix timestamp i
+        '''
+        #copy the params dictionary so concurrent windows do not overwrite each others start time
+        params = dict(self.params)
+        params["from"] = str(i)
+
+        return instruments.InstrumentsCandles(instrument=self.currency_pair,params=params)
+
+    def window_page(self, i, end, data):
+        '''
+        (int, int, dictionary)->(pandas dataframe, int)
+        Parse the response of the page starting at i of the window ending at end. Returns the candles before the
+        start of the next page, stored if a store is used, and the start of the next page.
+        '''
+        end_ns = np.int64(end) * 10**9
+
+        df = parse_candles(data['candles'], self.MBA_candles, self.instrumentation)
+        times = df['Time'].values.astype(np.int64)
+
+        #a short page means the present has been reached, otherwise the next page starts at the last candle returned
+        if len(df) < self.max_no_candles or times[-1] >= end_ns or times[-1] <= np.int64(i) * 10**9:
+            next_i = end
+        else:
+            next_i = int(times[-1] // 10**9)
+
+        df = df[(times >= np.int64(i) * 10**9) & (times < np.int64(next_i) * 10**9)].reset_index(drop=True)
+        df['Seq Cnt'] = df.index
+
+        if not df.empty:
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Read Time Start %s to Time End %s", df['Time'].iloc[0], df['Time'].iloc[-1])
+            if self.instrumentation is not None:
+                self.instrumentation.event('page', instrument=self.currency_pair, granularity=self.time_interval,
+                                           start=df['Time'].iloc[0], end=df['Time'].iloc[-1], rows=len(df))
+
+        if self.store is not None:
+            with stage(self.instrumentation, 'store'):
+                self.store_window((i, next_i), df)
+
+        return df, next_i
+
+    def store_window(self, window, df):
+        '''
+        (tuple, pandas dataframe)->(None)
+        Write the complete candles of a fetched window to the store. The covered range stops at the first incomplete
+        candle, or now, so the forming candle is requested again on the next run.
+        '''
+        covered_end = min(window[1], int(time.time()))
+        incomplete = df['Complete'].values == False
+
+        if incomplete.any():
+            first_incomplete = df['Time'].values[incomplete][0].astype('datetime64[s]').astype(np.int64)
+            covered_end = min(covered_end, int(first_incomplete))
+
+        if covered_end > window[0]:
+            self.store.write(self.currency_pair, self.time_interval, self.price_candles, df[~incomplete], window[0], covered_end)
     
+    def extract_resampled(self, time_intervals):
+        '''
+        (list of strings)->(dictionary of pandas dataframes)
+        Download self.time_interval once and derive every coarser granularity in time_intervals locally with
+        resample_candles, instead of downloading the same history again per granularity.
+        Returns {granularity: dataframe}, each in the extract_candles schema. self.time_interval should be the finest
+        granularity and must divide every requested granularity.
+        '''
+        return self.derive_resampled(self.extract_candles(), time_intervals)
+
+    def derive_resampled(self, base, time_intervals):
+        '''
+        (pandas dataframe, list of strings)->(dictionary of pandas dataframes)
+        Derive the coarser time_intervals from an extract_candles dataset of self.time_interval
+        '''
+        results = {self.time_interval: base}
+
+        #candles are only final up to the end of the requested range, the present or the first incomplete base candle
+        known_until = min(self.end_date, time.time())
+        if not base.Complete.all():
+            known_until = min(known_until, base.index[~base.Complete.values][0].value / 10**9)
+
+        for time_interval in time_intervals:
+            if time_interval == self.time_interval:
+                continue
+
+            df = resample_candles(base, time_interval, self.time_interval, self.start_date, known_until)
+
+            if self.complete_only == True:
+                df = df[df.Complete == True]
+
+            df['Seq Cnt'] = np.arange(len(df))
+            df['index diff'] = df.index.to_series().diff()
+            results[time_interval] = compact_candles(df, self.dtype_policy, self.price_decimals)
+
+        return results
+
     def unix_timestamp(self,time_data):
         self.datetime_format_string = '%Y-%m-%d'
         return int(datetime.datetime.strptime(str(time_data), self.datetime_format_string).timestamp())
     
     def time_interval_id(self):
-        self.time_interval_dict = {'M':3000000,'W':604800,'D':86400,
-                                   'H12':43200,'H8':28800,'H6':21600,'H4':14400, 'H3':10800, 'H2':7200, 'H1':3600,
-                                   'M30':1800,'M15':900,'M10':600,'M5':300,'M4':240,'M2':120,'M1':60,
-                                   'S30':30,'S15':15,'S10':10,'S5':5}
+        self.time_interval_dict = oanda_granularity_seconds()
         return self.time_interval_dict
     
     def candle_check(self):
-        #To Complete
-        return None
+        '''
+        ()->(dictionary)
+        Run candle_qc over the extracted dataset. The report is returned and kept in self.qc_report, the boolean
+        mask of flagged rows is kept in self.qc_mask
+        '''
+        self.qc_report, self.qc_mask = candle_qc(self.dataset, self.time_interval)
+
+        return self.qc_report
+
+#column names of the parsed candle blocks, in output order
+CANDLE_PRICE_COLUMNS = {'mid': ['Open', 'High', 'Low', 'Close'],
+                        'bid': ['Open Bid', 'High Bid', 'Low Bid', 'Close Bid'],
+                        'ask': ['Open Ask', 'High Ask', 'Low Ask', 'Close Ask']}
+
+#memory representations of the candle dataframes, see compact_candles
+CANDLE_DTYPE_POLICIES = ['float64', 'float32', 'pips']
+
+def compact_candles(df, dtype_policy = 'float64', price_decimals = None):
+    '''
+    (pandas dataframe, str, int)->(pandas dataframe)
+    Convert a candle dataframe to the memory representation of dtype_policy. Columns already converted are left
+    unchanged, so the conversion can be applied again to a combined or resampled dataframe.
+
+    'float64' - unchanged, 8 byte prices
+    'float32' - 4 byte prices. Relative error at most 2**-24 (6e-8), e.g. 7e-8 on EUR_USD 1.10523 and 9e-6 on
+    USD_JPY 150.123, well below the quoted precision. Rounding back to the quoted decimals recovers the exact quote
+    while price * 10**decimals < 2**23, which holds for every Oanda FX and metal quote.
+    'pips' - 4 byte int32 prices scaled by 10**price_decimals, e.g. EUR_USD 1.10523 -> 110523. Exact, Oanda quotes a
+    fixed number of decimals per instrument. Range up to 2**31 / 10**price_decimals. Restore with expand_candles.
+    Raises ValueError if a price has more than price_decimals decimals or is out of range, rather than rounding it.
+    An empty dataframe is cast to int32 without price_decimals.
+
+    Both compact policies store Volume and Seq Cnt as int32 (exact, volume is a tick count). Complete stays a 1 byte
+    bool. MBA rows shrink from 129 to 73 bytes including the Time index and 'index diff'.
+    price_decimals - decimals of the scaled prices, required by 'pips', see candle_price_decimals
+    '''
+    if dtype_policy == 'float64':
+        return df
+
+    if dtype_policy not in CANDLE_DTYPE_POLICIES:
+        raise ValueError(f"Unknown dtype policy {dtype_policy}")
+
+    df = df.copy()
+
+    scale = None
+    if dtype_policy == 'pips':
+        if price_decimals is None and len(df):
+            raise ValueError("price_decimals is required by the 'pips' dtype policy")
+        scale = 10**price_decimals if price_decimals is not None else 1
+
+    for block in CANDLE_PRICE_COLUMNS:
+        for name in CANDLE_PRICE_COLUMNS[block]:
+            if name not in df.columns or df[name].dtype.kind != 'f':
+                continue
+            if dtype_policy == 'float32':
+                df[name] = df[name].values.astype(np.float32)
+            else:
+                values = df[name].values * scale
+                scaled = np.rint(values)
+                if len(scaled):
+                    #rounding error, in place
+                    largest = max(scaled.max(), -scaled.min())
+                    np.subtract(values, scaled, out=values)
+                    np.abs(values, out=values)
+                    if values.max() > 1e-8 * max(1.0, largest):
+                        raise ValueError(f"{name} prices have more than {price_decimals} decimals")
+                    if largest >= 2**31:
+                        raise ValueError(f"{name} prices are out of the int32 range at {price_decimals} decimals")
+                df[name] = scaled.astype(np.int32)
+
+    for name in ('Volume', 'Seq Cnt'):
+        if name in df.columns:
+            df[name] = df[name].values.astype(np.int32)
+
+    return df
+
+def expand_candles(df, price_decimals = None):
+    '''
+    (pandas dataframe, int)->(pandas dataframe)
+    Convert a compact_candles dataframe back to float64 prices and volume. price_decimals is required for 'pips'
+    dataframes, float32 prices are rounded back to price_decimals when it is given.
+    '''
+    df = df.copy()
+
+    for block in CANDLE_PRICE_COLUMNS:
+        for name in CANDLE_PRICE_COLUMNS[block]:
+            if name not in df.columns:
+                continue
+            values = df[name].values
+            if values.dtype.kind == 'i':
+                df[name] = values / 10**price_decimals
+            elif price_decimals is not None:
+                df[name] = np.round(values.astype(np.float64), price_decimals)
+            else:
+                df[name] = values.astype(np.float64)
+
+    if 'Volume' in df.columns:
+        df['Volume'] = df['Volume'].values.astype(np.float64)
+
+    return df
+
+def candle_price_decimals(df, max_decimals = 6):
+    '''
+    (pandas dataframe, int)->(int)
+    Return the number of decimals the float64 prices of a candle dataframe are quoted to, at most max_decimals
+    '''
+    names = [name for block in CANDLE_PRICE_COLUMNS for name in CANDLE_PRICE_COLUMNS[block] if name in df.columns]
+    prices = df[names].values.astype(np.float64).ravel()
+
+    for decimals in range(max_decimals):
+        scaled = prices * 10**decimals
+        if np.all(np.abs(scaled - np.rint(scaled)) < 1e-8 * np.maximum(1.0, np.abs(scaled))):
+            return decimals
+
+    return max_decimals
+
+def parse_candles(candles, MBA_candles = False, instrumentation = None):
+    '''
+    (list of dicts, bool, Instrumentation)->(pandas dataframe)
+    Convert the raw data['candles'] list of an Oanda InstrumentsCandles response into a typed, columnar dataframe.
+
+    Columns: Time (datetime64[ns], UTC naive), Open, High, Low, Close, [Open Bid ... Close Ask if MBA_candles],
+    Volume (float64), Complete (bool)
+
+    The OHLC strings of every price block are gathered in a single pass and converted to float64 in one numpy call,
+    the RFC3339 timestamps are converted to datetime64[ns] in one vectorized step.
+    instrumentation - times the 'parse prices', 'parse time' and 'frame' stages and counts rows. Default None
+    '''
+    blocks = ['mid', 'bid', 'ask'] if MBA_candles else ['mid']
+    n = len(candles)
+
+    ohlc = itemgetter('o', 'h', 'l', 'c')
+    get_blocks = itemgetter(*blocks)
+
+    with stage(instrumentation, 'parse prices'):
+        if MBA_candles:
+            prices = [v for x in candles for block in get_blocks(x) for v in ohlc(block)]
+        else:
+            prices = [v for x in candles for v in ohlc(get_blocks(x))]
+        prices = np.array(prices, dtype=np.float64).reshape(n, 4 * len(blocks))
+
+        columns = {}
+        for b, block in enumerate(blocks):
+            for c, name in enumerate(CANDLE_PRICE_COLUMNS[block]):
+                columns[name] = prices[:, 4 * b + c]
+
+        columns['Volume'] = np.fromiter((x['volume'] for x in candles), dtype=np.float64, count=n)
+        columns['Complete'] = np.fromiter((x['complete'] for x in candles), dtype=bool, count=n)
+
+    with stage(instrumentation, 'parse time'):
+        times = parse_rfc3339([x['time'] for x in candles])
+
+    with stage(instrumentation, 'frame'):
+        df = pd.DataFrame({'Time': times, **columns})
+
+    if instrumentation is not None:
+        instrumentation.add('rows', n)
+
+    return df
+
+def parse_rfc3339(times):
+    '''
+    (list of strings)->(numpy datetime64[ns] array)
+    Convert Oanda RFC3339 timestamps e.g. '2023-04-03T08:00:00.000000000Z' to naive UTC datetime64[ns]
+    '''
+    times = np.array(times)
+
+    #oanda always returns nanosecond precision, 30 characters. Truncating the string dtype by one character drops the
+    #trailing 'Z' without a python level loop
+    if times.dtype == np.dtype('U30'):
+        return times.astype('U29').astype('datetime64[ns]')
+
+    if times.size == 0:
+        return times.astype('datetime64[ns]')
+
+    return pd.to_datetime(times, utc=True).tz_localize(None).values
+
+def resample_candles(df, time_interval, base_interval, start_time = None, known_until = None):
+    '''
+    (pandas dataframe, str, str, float, float)->(pandas dataframe)
+    Aggregate Time indexed candles of granularity base_interval into the coarser granularity time_interval, using the
+    same alignment as the Oanda requests (UTC, dailyAlignment 0, weekly on Friday).
+
+    Open = first, High = max, Low = min, Close = last of every price block, Volume = sum.
+    A resampled candle is Complete only if all of its base candles are complete and it closes at or before known_until
+    (unix timestamp, default now). Candles opening before start_time (unix timestamp) are dropped, as they would only
+    hold part of their base candles. The base candles must be sorted by time with no duplicates.
+    '''
+    steps = oanda_granularity_seconds()
+    if time_interval not in ('W', 'M') and (steps[time_interval] <= steps[base_interval] or steps[time_interval] % steps[base_interval]):
+        raise ValueError(f"{time_interval} candles can not be built from {base_interval} candles")
+    if time_interval in ('W', 'M') and 86400 % steps[base_interval]:
+        raise ValueError(f"{time_interval} candles can not be built from {base_interval} candles")
+
+    if known_until is None:
+        known_until = time.time()
+
+    blocks = [block for block in CANDLE_PRICE_COLUMNS if CANDLE_PRICE_COLUMNS[block][0] in df.columns]
+
+    times = df.index.values.astype('datetime64[ns]')
+    opens = candle_open_time(times, time_interval)
+
+    #the base candles are sorted, so each resampled candle is a contiguous run of equal open times
+    n = len(opens)
+    starts = np.flatnonzero(np.r_[True, opens[1:] != opens[:-1]]) if n else np.array([], dtype=np.int64)
+    ends = np.r_[starts[1:], n] - 1
+
+    columns = {}
+    for block in blocks:
+        o, h, l, c = CANDLE_PRICE_COLUMNS[block]
+        columns[o] = df[o].values[starts]
+        columns[h] = np.maximum.reduceat(df[h].values, starts) if n else df[h].values[:0]
+        columns[l] = np.minimum.reduceat(df[l].values, starts) if n else df[l].values[:0]
+        columns[c] = df[c].values[ends]
+
+    columns['Volume'] = np.add.reduceat(df['Volume'].values, starts) if n else df['Volume'].values[:0]
+
+    open_times = opens[starts]
+    if time_interval == 'M':
+        close_times = (open_times.astype('datetime64[M]') + 1).astype('datetime64[ns]')
+    else:
+        close_times = open_times + np.timedelta64(steps[time_interval], 's')
+
+    complete = np.logical_and.reduceat(df['Complete'].values, starts) if n else np.array([], dtype=bool)
+    columns['Complete'] = complete & (close_times <= np.datetime64(int(known_until), 's'))
+
+    resampled = pd.DataFrame(columns, index=pd.DatetimeIndex(open_times, name='Time'))
+
+    if start_time is not None:
+        resampled = resampled[resampled.index >= pd.Timestamp(int(start_time), unit='s')]
+
+    return resampled
+
+def candle_qc(df, time_interval):
+    '''
+    (pandas dataframe, str)->(dictionary, numpy bool array)
+    Vectorized integrity check of a candle dataset in a single pass over its columns. df is indexed by Time or has a
+    Time column, bid/ask checks run when the MBA columns are present.
+
+    Returns a report dictionary of counts and a boolean mask, True for every row flagged by a check:
+    duplicates - timestamp equal to an earlier row
+    non_monotonic - timestamp earlier than the previous row
+    ohlc_errors - low above open/close/high, or high below open/close, in any price block
+    bid_ask_crossed - bid above ask for any of open/high/low/close
+    gaps - rows following missing candles on the granularity grid, missing_candles is the number of candles missing
+    weekend_gaps - gaps whose missing candles all open inside the FX weekend closure (Friday 20:00 to Sunday 23:00
+    UTC, wide enough for both daylight saving settings). They are expected, counted separately and not flagged.
+    Holiday closures are reported as gaps. W and M candles are not checked for gaps.
+    '''
+    if 'Time' in df.columns:
+        times = df['Time'].values.astype('datetime64[ns]').astype(np.int64)
+    else:
+        times = df.index.values.astype('datetime64[ns]').astype(np.int64)
+
+    n = len(times)
+    mask = np.zeros(n, dtype=bool)
+    report = {'rows': n}
+
+    #time ordering
+    delta = np.diff(times)
+    non_monotonic = np.r_[False, delta < 0]
+
+    if non_monotonic.any():
+        duplicates = pd.Index(times).duplicated()
+    else:
+        duplicates = np.r_[False, delta == 0]
+
+    report['duplicates'] = int(duplicates.sum())
+    report['non_monotonic'] = int(non_monotonic.sum())
+    mask |= duplicates | non_monotonic
+
+    #ohlc consistency of every price block
+    ohlc = np.zeros(n, dtype=bool)
+    blocks = [block for block in CANDLE_PRICE_COLUMNS if CANDLE_PRICE_COLUMNS[block][0] in df.columns]
+    for block in blocks:
+        o, h, l, c = (df[name].values for name in CANDLE_PRICE_COLUMNS[block])
+        ohlc |= (l > o) | (l > c) | (l > h) | (h < o) | (h < c)
+    report['ohlc_errors'] = int(ohlc.sum())
+    mask |= ohlc
+
+    #bid above ask - every bid price must be at or below the matching ask price
+    if 'bid' in blocks and 'ask' in blocks:
+        crossed = np.zeros(n, dtype=bool)
+        for bid, ask in zip(CANDLE_PRICE_COLUMNS['bid'], CANDLE_PRICE_COLUMNS['ask']):
+            crossed |= df[bid].values > df[ask].values
+        report['bid_ask_crossed'] = int(crossed.sum())
+        mask |= crossed
+
+    #missing candles on the granularity grid
+    report['gaps'] = 0
+    report['missing_candles'] = 0
+    report['weekend_gaps'] = 0
+
+    if time_interval not in ('W', 'M') and n > 1:
+        step = np.int64(oanda_granularity_seconds()[time_interval]) * 10**9
+        gap = np.flatnonzero(delta > step)
+
+        #open time of the first and last missing candle of every gap, in seconds
+        gap_first = (times[gap] + step) // 10**9
+        gap_last = (times[gap + 1] - step) // 10**9
+
+        #friday of the week the gap starts in, unix day zero is a Thursday
+        day = gap_first // 86400
+        friday = day - (day + 3) % 7 + 4
+        weekend = (gap_first >= friday * 86400 + 20 * 3600) & (gap_last < (friday + 2) * 86400 + 23 * 3600)
+
+        unexpected = gap[~weekend]
+
+        report['gaps'] = len(unexpected)
+        report['missing_candles'] = int((delta[unexpected] // step - 1).sum())
+        report['weekend_gaps'] = int(weekend.sum())
+        mask[unexpected + 1] = True
+
+    report['flagged_rows'] = int(mask.sum())
+
+    return report, mask
+
+def request_with_retry(client, endpoint, max_retries = 5, retry_backoff = 1.0):
+    '''
+    (oandapyV20 API, APIRequest, int, float)->(dict)
+    Perform client.request(endpoint), retrying with jittered exponential backoff on HTTP 429, 5xx and connection errors.
+    Any other error, or the last failed attempt, is raised to the caller.
+    A RequestScheduler client applies its own rate limit, Retry-After handling and metrics with these retry settings,
+    any other client is sent through an unlimited RequestScheduler for the retry policy only.
+    '''
+    if not isinstance(client, RequestScheduler):
+        client = RequestScheduler(client, requests_per_second=None)
+
+    return client.request(endpoint, max_retries, retry_backoff)
 
 def oanda_granularity_list():
     '''
@@ -312,4 +1158,36 @@ def oanda_granularity_list():
     Return a list of all granularity strings compatible with the Oanda API
     '''
     return  ['M','W','D','H12','H8','H6','H4','H3','H2','H1',
-                'M30','M15','M10','M5','M4','M2','M1','S30','S15','S10','S5'] 
\ No newline at end of file
+                'M30','M15','M10','M5','M4','M2','M1','S30','S15','S10','S5'] 
+
+def oanda_granularity_seconds():
+    '''
+    ()->(dictionary)
+    Return the number of seconds in one candle of every Oanda granularity. 'M' (month) is an approximation
+    '''
+    return {'M':3000000,'W':604800,'D':86400,
+            'H12':43200,'H8':28800,'H6':21600,'H4':14400, 'H3':10800, 'H2':7200, 'H1':3600,
+            'M30':1800,'M15':900,'M10':600,'M5':300,'M4':240,'M2':120,'M1':60,
+            'S30':30,'S15':15,'S10':10,'S5':5}
+
+def candle_open_time(times, granularity):
+    '''
+    (numpy datetime64[ns] array, str)->(numpy datetime64[ns] array)
+    Return the open time of the candle each timestamp falls in, using the alignment requested by the classes in
+    this module: alignmentTimezone UTC, dailyAlignment 0 and Oanda's default weeklyAlignment of Friday
+    '''
+    times = np.asarray(times, dtype='datetime64[ns]')
+
+    if granularity == 'M':
+        return times.astype('datetime64[M]').astype('datetime64[ns]')
+
+    ns = times.astype(np.int64)
+    step = np.int64(oanda_granularity_seconds()[granularity]) * 10**9
+
+    if granularity == 'W':
+        #unix time zero is a Thursday, weekly candles open on Friday 00:00 UTC
+        friday = np.int64(86400) * 10**9
+        return ((ns - friday) // step * step + friday).astype('datetime64[ns]')
+
+    #every intraday step divides a day evenly, so flooring unix time aligns candles to 00:00 UTC
+    return (ns // step * step).astype('datetime64[ns]')
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Build Oanda candles in-process from the pricing stream
+"""
+
+
+###########################################
+#import libraries
+import pandas as pd
+import numpy as np
+import oandapyV20.endpoints.pricing as pricing
+from collections import deque
+import json
+from trade_read.oanda_read import (CANDLE_PRICE_COLUMNS, candle_open_time, oanda_granularity_list,
+                                   oanda_granularity_seconds)
+from trade_read.oanda_client import shared_client, oanda_account_id
+
+
+class OandaStreamCandles():
+    """
+    Class to build OHLC candles of a specified instrument from the Oanda pricing stream
+
+    Keyword Args:
+    base currency: e.g USD - Required
+    quote currency: e,g EUR - Required
+    Time Interval e.g H4 - any granularity in oanda_granularity_list()
+    Price Candles options 'M' or 'MBA' - 'mid', 'bid','ask'
+    No Candles - number of completed candles kept, oldest candles are dropped. Default 500
+    Account ID - Oanda account used to open the pricing stream. If None the OANDA_ACCOUNT_ID environment variable
+    Client - oandapyV20 API compatible client. If None the shared pooled client is used
+
+    Candles use the same alignment (UTC, dailyAlignment 0, weekly on Friday) and the same dataframe schema as
+    OandaRecentCandles.get_candles. Prices are built from the best bid/ask of every PRICE message, mid = (bid + ask) / 2.
+    Volume is the number of price messages in the candle. The pricing stream is throttled by Oanda, so Volume and the
+    intra candle high/low can differ slightly from the candles endpoint.
+
+    A candle is marked Complete when a PRICE or HEARTBEAT message arrives at or after its close time.
+
+    ***NOTE*** TIME SETTINGS ARE UTC, REF ZERO HOURS
+
+    Functions
+    open_stream -> open the Oanda pricing stream for the instrument, returns a generator of message dictionaries
+
+    consume -> update the candles from an iterable of stream messages, live or replayed, and return get_candles()
+
+    follow -> generator updating the candles from an iterable of messages, yields get_candles() at every candle close
+
+    get_candles -> dataframe of the kept candles plus the forming candle
+    """
+
+    def __init__(self,
+            base_currency = None,
+            quote_currency = None,
+            time_interval = None,
+            MBA_candles = False,
+            no_candles = 500,
+            complete_only = True,
+            account_id = None,
+            client = None
+            ):
+
+            #set variables to  class self
+            self.base_currency = base_currency
+            self.quote_currency = quote_currency
+            self.time_interval = time_interval
+            self.MBA_candles = MBA_candles
+            self.no_candles = no_candles
+            self.complete_only = complete_only
+            self.account_id = account_id
+
+            #create trading pair from base and quote currency
+            self.currency_pair = str( self.quote_currency + '_' + self.base_currency)
+
+            if self.time_interval not in oanda_granularity_list():
+                raise ValueError(f"Unknown Oanda granularity {self.time_interval}")
+
+            self.blocks = ['mid', 'bid', 'ask'] if self.MBA_candles else ['mid']
+
+            #completed candles as row dictionaries, the forming candle and its close time in unix nanoseconds
+            self.candles = deque(maxlen=self.no_candles)
+            self.forming = None
+            self.forming_close = None
+
+            self.client = client
+
+    def open_stream(self):
+        '''
+        ()->(generator of dictionaries)
+        Open the Oanda pricing stream for the instrument
+        '''
+        if self.client is None:
+            self.client = shared_client()
+
+        if self.account_id is None:
+            self.account_id = oanda_account_id()
+
+        r = pricing.PricingStream(accountID=self.account_id, params={"instruments": self.currency_pair})
+
+        return self.client.request(r)
+
+    def consume(self, messages):
+        '''
+        (iterable of dictionaries)->(pandas dataframe)
+        Update the candles from every message and return get_candles()
+        '''
+        for message in messages:
+            self.update(message)
+
+        return self.get_candles()
+
+    def follow(self, messages):
+        '''
+        (iterable of dictionaries)->(generator of pandas dataframes)
+        Update the candles from every message and yield get_candles() every time a candle completes
+        '''
+        for message in messages:
+            if self.update(message):
+                yield self.get_candles()
+
+    def update(self, message):
+        '''
+        (dictionary)->(bool)
+        Apply a single stream message. Returns True if the message completed the forming candle
+        '''
+        if message.get('type') not in ('PRICE', 'HEARTBEAT'):
+            return False
+        if message.get('type') == 'PRICE' and message.get('instrument', self.currency_pair) != self.currency_pair:
+            return False
+
+        time_ns = stream_time(message['time'])
+
+        completed = False
+        if self.forming is not None and time_ns >= self.forming_close:
+            self.forming['Complete'] = True
+            self.candles.append(self.forming)
+            self.forming = None
+            completed = True
+
+        if message['type'] == 'HEARTBEAT' or not message.get('bids') or not message.get('asks'):
+            return completed
+
+        bid = float(message['bids'][0]['price'])
+        ask = float(message['asks'][0]['price'])
+        prices = {'mid': (bid + ask) / 2, 'bid': bid, 'ask': ask}
+
+        if self.forming is None:
+            open_time = candle_open_time(np.array([time_ns], dtype='datetime64[ns]'), self.time_interval)[0]
+            self.forming = {'Time': open_time}
+            for block in self.blocks:
+                o, h, l, c = CANDLE_PRICE_COLUMNS[block]
+                self.forming[o] = self.forming[h] = self.forming[l] = self.forming[c] = prices[block]
+            self.forming['Volume'] = 0.0
+            self.forming['Complete'] = False
+            self.forming_close = self.close_time(open_time)
+
+        for block in self.blocks:
+            o, h, l, c = CANDLE_PRICE_COLUMNS[block]
+            price = prices[block]
+            if price > self.forming[h]:
+                self.forming[h] = price
+            if price < self.forming[l]:
+                self.forming[l] = price
+            self.forming[c] = price
+        self.forming['Volume'] += 1
+
+        return completed
+
+    def close_time(self, open_time):
+        '''
+        (numpy datetime64)->(int)
+        Return the close time, in unix nanoseconds, of the candle opening at open_time
+        '''
+        if self.time_interval == 'M':
+            return int((open_time.astype('datetime64[M]') + 1).astype('datetime64[ns]').astype(np.int64))
+
+        return int(open_time.astype(np.int64)) + oanda_granularity_seconds()[self.time_interval] * 10**9
+
+    def get_candles(self):
+        '''
+        ()->(pandas dataframe)
+        Return the kept candles and the forming candle in the OandaRecentCandles.get_candles schema
+        '''
+        rows = list(self.candles)
+        if self.forming is not None:
+            rows.append(self.forming)
+
+        columns = ['Time'] + [name for block in self.blocks for name in CANDLE_PRICE_COLUMNS[block]] + ['Volume', 'Complete']
+
+        self.df = pd.DataFrame(rows, columns=columns)
+        self.df['Time'] = self.df['Time'].values.astype('datetime64[ns]')
+        self.df = self.df.astype({'Volume': np.float64, 'Complete': bool})
+
+        if self.complete_only == True:
+            self.df = self.df[self.df.Complete == True]
+
+        self.df.set_index('Time', inplace=True)
+
+        return self.df
+
+
+def stream_time(time_string):
+    '''
+    (str)->(int)
+    Convert a pricing stream RFC3339 time string to unix nanoseconds
+    '''
+    return int(np.datetime64(time_string.rstrip('Z'), 'ns').astype(np.int64))
+
+
+def replay_messages(path):
+    '''
+    (str)->(generator of dictionaries)
+    Read recorded pricing stream messages from a file with one JSON message per line, for offline replay
+    '''
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def record_messages(messages, path):
+    '''
+    (iterable of dictionaries, str)->(generator of dictionaries)
+    Pass stream messages through unchanged while appending each one to a JSON lines file for later replay
+    '''
+    with open(path, 'a') as f:
+        for message in messages:
+            f.write(json.dumps(message) + '\n')
+            yield message
@@ -2,10 +2,107 @@ import yfinance as yf
 import pandas as pd
 import numpy as np
 import re
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from trade_read.instrumentation import stage
 #from urllib.error import HTTPError
 
 
+class ticker_info_cache:
+
+    '''
+    Thread safe memoization of yf.Ticker('TICKER').info with a time to live and a least recently used size limit
+
+    ttl : float, seconds an entry stays valid. Default 86400 (one day)
+    maxsize : int, number of tickers kept in memory, the least recently used ticker is dropped first. Default 1024
+    path : str, optional directory backing the cache on disk (one json file per ticker) so entries survive
+           process restarts. Default None, memory only
+    '''
+
+    def __init__(self, ttl = 86400, maxsize = 1024, path = None):
+
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        if self.path is not None:
+            os.makedirs(self.path, exist_ok = True)
+
+    def get(self, ticker):
+        '''
+        Return the cached info dictionary of a ticker, or None if missing or expired
+        '''
+        with self.lock:
+            entry = self.entries.get(ticker)
+            if entry is not None:
+                self.entries.move_to_end(ticker)
+
+        if entry is None and self.path is not None:
+            entry = self.read_disk(ticker)
+            if entry is not None:
+                self.store(ticker, entry)
+
+        if entry is None or time.time() - entry[0] > self.ttl:
+            return None
+
+        return entry[1]
+
+    def set(self, ticker, info):
+        '''
+        Cache the info dictionary of a ticker, written through to disk if a path is set
+        '''
+        entry = (time.time(), info)
+        self.store(ticker, entry)
+
+        if self.path is not None:
+            self.write_disk(ticker, entry)
+
+    def store(self, ticker, entry):
+
+        with self.lock:
+            self.entries[ticker] = entry
+            self.entries.move_to_end(ticker)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last = False)
+
+    def clear(self):
+
+        with self.lock:
+            self.entries.clear()
+
+    def disk_file(self, ticker):
+
+        return os.path.join(self.path, re.sub(r'[^\w\-.^=]', '_', ticker) + '.json')
+
+    def read_disk(self, ticker):
+
+        try:
+            with open(self.disk_file(ticker)) as f:
+                saved = json.load(f)
+            return (saved['time'], saved['info'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def write_disk(self, ticker, entry):
+
+        #write to a temporary file and move into place, readers never see a partial file
+        file = self.disk_file(ticker)
+        tmp = file + '.tmp.' + str(threading.get_ident())
+        with open(tmp, 'w') as f:
+            json.dump({'time': entry[0], 'info': entry[1]}, f, default = str)
+        os.replace(tmp, file)
+
+#module wide cache shared by every reader unless another cache is supplied
+info_cache = ticker_info_cache()
+
+
 class yfinance_ticker_reader:
     
     '''
@@ -25,13 +122,18 @@ class yfinance_ticker_reader:
         end: str
             Download end date string (YYYY-MM-DD) or _datetime.
             Default is now
+
+    instrumentation : Instrumentation timing the 'download' and 'info' stages and counting rows. Default None, disabled
     '''
 
-    def __init__(self, ticker = None): 
+    def __init__(self, ticker = None, info_cache = info_cache, instrumentation = None): 
         
         #instantiate the class
         
         self.ticker = ticker
+        #ticker_info cache, None = always request yahoo finance
+        self.info_cache = info_cache
+        self.instrumentation = instrumentation
 
     def check_periods(self, per_string):
         '''
@@ -108,7 +210,7 @@ class yfinance_ticker_reader:
         
         try:
 
-            return {'code': 400, 'ticker ohlc':yf.download(self.ticker, start=start,end = end,interval = interval,progress=progress)}
+            return {'code': 400, 'ticker ohlc':self.download(self.ticker, start=start,end = end,interval = interval,progress=progress)}
         
         except Exception as ex:
             if type(ex).__name__ == 'HTTPError':
@@ -153,7 +255,7 @@ class yfinance_ticker_reader:
 
         try:
 
-            return {'code': 400, 'ticker ohlc':yf.download(self.ticker,period = period,interval = interval, progress=progress)}
+            return {'code': 400, 'ticker ohlc':self.download(self.ticker,period = period,interval = interval, progress=progress)}
         
         except Exception as ex:
             if type(ex).__name__ == 'HTTPError':
@@ -166,6 +268,19 @@ class yfinance_ticker_reader:
             return {'code': 201, 'ticker ohlc':None}   
     
 
+    def download(self, tickers, **kwargs):
+        '''
+        Call yf.download(tickers, **kwargs), timed as the 'download' stage when instrumentation is enabled
+        '''
+        if self.instrumentation is None:
+            return yf.download(tickers, **kwargs)
+
+        with stage(self.instrumentation, 'download'):
+            data = yf.download(tickers, **kwargs)
+        self.instrumentation.add('rows', len(data))
+
+        return data
+
     def ticker_info(self):
         """
         Returns a dictionary of stastus code  + stock stats yf.Ticker('TICKER').info
@@ -185,13 +300,26 @@ class yfinance_ticker_reader:
         Raises:
         HTTPError: if ticker string is not recognised by yahoo fiunance API.
 
+        Successful results are memoized in self.info_cache for the cache ttl.
+
         """
 
+        if self.info_cache is not None:
+            info = self.info_cache.get(self.ticker)
+            if info is not None:
+                return {'code': 400, 'ticker stats':info}
+
         dis = yf.Ticker(self.ticker)
 
         try:
             
-            return {'code': 400, 'ticker stats':dis.info}
+            with stage(self.instrumentation, 'info'):
+                info = dis.info
+
+            if self.info_cache is not None:
+                self.info_cache.set(self.ticker, info)
+
+            return {'code': 400, 'ticker stats':info}
         
         except Exception as ex:
                 if type(ex).__name__ == 'HTTPError':
@@ -202,4 +330,178 @@ class yfinance_ticker_reader:
                     print(type(ex).args)
                 return {'code': 201, 'ticker stats':None}
 
-                
\ No newline at end of file
+                
+class yfinance_universe_reader:
+
+    '''
+    Class to read a universe of stock tickers from yahoo finance API, using the multi ticker mode of yf.download
+
+    Tickers are split into batches of batch_size, each batch is a single yf.download call. Within a batch yfinance
+    downloads the tickers on threads (threads = True or number of threads, False = sequential).
+    Batches run one after another - yf.download keeps its results in module level state, so concurrent calls from
+    separate threads would overwrite each other.
+
+    Results are returned per ticker under the yfinance_ticker_reader convention {'code', 'ticker ohlc'}, a ticker
+    that fails returns code 201 without failing the rest of its batch.
+
+    tickers : list of str
+    batch_size : int, number of tickers per yf.download call. Default 100
+    threads : bool / int, yf.download thread fan-out within a batch. Default True
+    info_cache : ticker_info_cache used by ticker_info_universe. Default module wide info_cache
+    instrumentation : Instrumentation shared by every batch and ticker. Default None, disabled
+
+    Period, interval and date validation and the yf.download calls go through a yfinance_ticker_reader held in
+    self.reader. The universe reader is not a yfinance_ticker_reader itself, it has no single ticker.
+    '''
+
+    def __init__(self, tickers = None, batch_size = 100, threads = True, info_cache = info_cache, instrumentation = None):
+
+        #instantiate the class
+
+        self.tickers = list(tickers)
+        self.batch_size = batch_size
+        self.threads = threads
+        self.info_cache = info_cache
+        self.instrumentation = instrumentation
+
+        #validation and download helper, not bound to a ticker
+        self.reader = yfinance_ticker_reader(None, info_cache, instrumentation)
+
+    def ticker_info_universe(self, max_workers = 8):
+        """
+        Returns a dictionary of ticker : {'code', 'ticker stats'} for every ticker in the universe
+
+        Tickers missing from the info cache are requested concurrently on max_workers threads and added to the cache.
+
+        Args:
+        max_workers = (int) number of concurrent yf.Ticker('TICKER').info requests, Default = 8.
+        Returns:
+        Dictionary of dictionaries, see yfinance_ticker_reader.ticker_info
+        """
+
+        readers = [yfinance_ticker_reader(ticker, self.info_cache, self.instrumentation) for ticker in self.tickers]
+
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            results = list(executor.map(lambda reader: reader.ticker_info(), readers))
+
+        return dict(zip(self.tickers, results))
+
+    def read_universe_pandas_start_end(self, start = None, end = None, interval = None, progress = False):
+        """
+        Returns a dictionary of ticker : {'code', 'ticker ohlc'} for every ticker in the universe
+
+        Args:
+        start = (string) start extraction period in yyyy-mm-dd format only, Default = None.
+        end  = (string) end extraction period in yyyy-mm-dd format only, Default = None.
+        interval = (string) datafrequency timeframe, must be in the following list: 1m,2m,5m,15m,30m,60m,90m,1h,1d,5d,1wk,1mo,3mo, Default = None.
+        progress = (Boolean) , print download progress to terminal, Default = False.
+        Returns:
+        Dictionary of dictionaries
+        'code': 400 = good, 201 = error raised - ticker not recognised or no data returned, 202 - incorrect date string format, 203 - incorrect date i.e 32 days in month. 204 - incorrect yahoo finance interval supplied
+        'ticker ohlc' : OHLC pandas dataframe of the ticker. Returns None if error raised.
+        """
+
+        if not self.reader.check_intervals(interval):
+            print("Incorrect yahoo finance interval submitted")
+            return self.universe_code(204)
+
+        #end = None reads up to now
+        for date_string in (start, end) if end is not None else (start,):
+            date_code = self.reader.date_string_format(date_string)
+            if date_code['code'] != 400:
+                return self.universe_code(date_code['code'])
+
+        return self.read_batches(start = start, end = end, interval = interval, progress = progress)
+
+    def read_universe_pandas_period(self, period = None, interval = None, progress = False):
+        """
+        Returns a dictionary of ticker : {'code', 'ticker ohlc'} for every ticker in the universe
+
+        Args:
+        period = (string) extraction period, must be in the following list: 1d,5d,1mo,3mo,6mo,1y,2y,5y,10y,ytd,max, Default = None.
+        interval = (string) datafrequency timeframe, must be in the following list: 1m,2m,5m,15m,30m,60m,90m,1h,1d,5d,1wk,1mo,3mo, Default = None.
+        progress = (Boolean) , print download progress to terminal, Default = False.
+        Returns:
+        Dictionary of dictionaries
+        'code': 400 = good, 201 = error raised - ticker not recognised or no data returned, 204 = error raised, incorrect yahoo finance period or interval supplied
+        'ticker ohlc' : OHLC pandas dataframe of the ticker. Returns None if error raised.
+        """
+
+        if not self.reader.check_periods(period):
+            print("Incorrect yahoo finance period submitted")
+            return self.universe_code(204)
+
+        if not self.reader.check_intervals(interval):
+            print("Incorrect yahoo finance interval submitted")
+            return self.universe_code(204)
+
+        return self.read_batches(period = period, interval = interval, progress = progress)
+
+    def universe_code(self, code):
+        '''
+        Return the same error code for every ticker in the universe
+        '''
+        return {ticker: {'code': code, 'ticker ohlc': None} for ticker in self.tickers}
+
+    def read_batches(self, **kwargs):
+        '''
+        Download the universe batch by batch, kwargs are passed to yf.download
+        '''
+        results = {}
+
+        for i in range(0, len(self.tickers), self.batch_size):
+            results.update(self.read_batch(self.tickers[i:i + self.batch_size], **kwargs))
+
+        return results
+
+    def read_batch(self, tickers, **kwargs):
+        '''
+        Download one batch of tickers in a single yf.download call and split the result per ticker
+        '''
+        try:
+
+            data = self.reader.download(tickers, group_by = 'ticker', threads = self.threads, **kwargs)
+            #per ticker failures are collected by yfinance instead of raised
+            errors = getattr(yf.shared, '_ERRORS', {})
+
+        except Exception as ex:
+            print(type(ex).__name__)
+            print(type(ex).args)
+
+            #the whole batch failed, read the tickers one at a time so a single bad ticker does not fail the batch
+            results = {}
+            for ticker in tickers:
+                try:
+                    df = self.reader.download(ticker, **kwargs)
+                except Exception:
+                    df = None
+                #yfinance returns an empty frame instead of raising for an unknown ticker
+                if df is None or df.empty:
+                    results[ticker] = {'code': 201, 'ticker ohlc': None}
+                else:
+                    results[ticker] = {'code': 400, 'ticker ohlc': df}
+            return results
+
+        results = {}
+
+        for ticker in tickers:
+
+            if ticker.upper() in errors:
+                results[ticker] = {'code': 201, 'ticker ohlc': None}
+                continue
+
+            if isinstance(data.columns, pd.MultiIndex):
+                if ticker.upper() not in data.columns.get_level_values(0):
+                    results[ticker] = {'code': 201, 'ticker ohlc': None}
+                    continue
+                df = data[ticker.upper()].dropna(how = 'all')
+            else:
+                #yf.download returns a flat frame when the batch holds a single ticker
+                df = data
+
+            if df.empty:
+                results[ticker] = {'code': 201, 'ticker ohlc': None}
+            else:
+                results[ticker] = {'code': 400, 'ticker ohlc': df}
+
+        return results